@@ -5,26 +5,51 @@ Implements secure authentication with JWT tokens, password hashing,
 role-based access control, and session management.
 """
 
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
-import secrets
+import base64
+import calendar
 import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
 
 from fastapi import Depends, HTTPException, status, Request
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.security import APIKeyHeader
 from pydantic import BaseModel, EmailStr, validator
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
+from cachetools import TTLCache
+from passlib.context import CryptContext
 import jwt
+import orjson
+from jwt.api_jws import PyJWS
 
+from . import models
+from .cache import SieveCache
 from .db import get_db
 
 # ===== Configuration =====
-SECRET_KEY = secrets.token_urlsafe(32)  # In production, use environment variable
+# Shared across worker processes; a per-process random key would reject tokens issued by sibling workers
+SECRET_KEY = os.getenv('JWT_SECRET_KEY')
+if not SECRET_KEY:
+    if int(os.getenv('WEB_CONCURRENCY', '1')) > 1:
+        raise RuntimeError('JWT_SECRET_KEY must be set when running more than one worker')
+    SECRET_KEY = secrets.token_urlsafe(32)  # single-process development only
+SECRET_KEY_BYTES = SECRET_KEY.encode('ascii')  # encoded once for every HMAC
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
 REFRESH_TOKEN_EXPIRE_DAYS = 7
+REFRESH_TOKEN_EXPIRE_SECONDS = REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60
+DECODE_CACHE_TTL = 30  # seconds a decoded token payload is reused
+USER_CACHE_TTL = 60  # seconds an authenticated user snapshot is reused
 
-security = HTTPBearer(auto_error=False)
+# Raw Authorization header; the Bearer prefix is stripped in bearer_token()
+security = APIKeyHeader(name="Authorization", auto_error=False)
 
 
 # ===== Pydantic Schemas =====
@@ -39,11 +64,22 @@ class UserRegister(BaseModel):
     def password_strength(cls, v):
         if len(v) < 8:
             raise ValueError('Password must be at least 8 characters')
-        if not any(c.isupper() for c in v):
+        # Single pass over the password collecting character classes as bit flags
+        flags = 0
+        for c in v:
+            if c.isupper():
+                flags |= 1
+            elif c.islower():
+                flags |= 2
+            elif c.isdigit():
+                flags |= 4
+            if flags == 7:
+                break
+        if not flags & 1:
             raise ValueError('Password must contain uppercase letter')
-        if not any(c.islower() for c in v):
+        if not flags & 2:
             raise ValueError('Password must contain lowercase letter')
-        if not any(c.isdigit() for c in v):
+        if not flags & 4:
             raise ValueError('Password must contain a digit')
         return v
 
@@ -75,80 +111,171 @@ class PasswordChange(BaseModel):
 
 
 # ===== Password Hashing =====
+# argon2id for new hashes; bcrypt hashes still verify and are upgraded on login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=65536,
+    argon2__parallelism=2,
+    bcrypt__rounds=12
+)
+
+
 def hash_password(password: str) -> str:
-    """Hash password using SHA-256 with salt."""
-    salt = secrets.token_hex(16)
-    password_hash = hashlib.pbkdf2_hmac(
-        'sha256',
-        password.encode('utf-8'),
-        salt.encode('utf-8'),
-        100000
-    ).hex()
-    return f"{salt}${password_hash}"
+    """Hash password using argon2id."""
+    return pwd_context.hash(password)
 
 
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash."""
+def _verify_legacy_password(password: str, hashed: str) -> bool:
+    """Verify password against a legacy PBKDF2-SHA256 `salt$hash` entry."""
     try:
-        salt, stored_hash = hashed.split('$')
-        password_hash = hashlib.pbkdf2_hmac(
+        salt, stored_hash = hashed.rsplit('$', 1)
+        stored_digest = bytes.fromhex(stored_hash)
+        password_digest = hashlib.pbkdf2_hmac(
             'sha256',
             password.encode('utf-8'),
             salt.encode('utf-8'),
             100000
-        ).hex()
-        return secrets.compare_digest(password_hash, stored_hash)
+        )
+        return hmac.compare_digest(password_digest, stored_digest)
     except (ValueError, AttributeError):
         return False
 
 
+def verify_password(password: str, hashed: str) -> bool:
+    """Verify password against hash."""
+    if not hashed:
+        return False
+    if pwd_context.identify(hashed, required=False) is None:
+        return _verify_legacy_password(password, hashed)
+    try:
+        return pwd_context.verify(password, hashed)
+    except (ValueError, TypeError):
+        return False
+
+
+# Verified against when no usable hash exists so every login pays the same cost
+_DUMMY_HASH = hash_password("dummy-constant-time-guard-password-xx")
+
+
+def password_needs_rehash(hashed: str) -> bool:
+    """Check whether a stored hash is legacy or uses outdated parameters."""
+    if pwd_context.identify(hashed, required=False) is None:
+        return True
+    return pwd_context.needs_update(hashed)
+
+
 # ===== JWT Token Functions =====
+# The HS256 header never changes, so it is serialized and base64-encoded once.
+_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b'=')
+
+
+def _datetime_to_ts(value):
+    """JSON fallback converting datetime claims to epoch seconds."""
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _fast_encode(payload: dict) -> str:
+    """Encode an HS256 JWT reusing the precomputed header."""
+    payload_json = orjson.dumps(payload, default=_datetime_to_ts, option=orjson.OPT_PASSTHROUGH_DATETIME)
+    payload_b64 = base64.urlsafe_b64encode(payload_json).rstrip(b'=')
+    signing_input = _HEADER_B64 + b'.' + payload_b64
+    signature = hmac.new(SECRET_KEY_BYTES, signing_input, hashlib.sha256).digest()
+    return (signing_input + b'.' + base64.urlsafe_b64encode(signature).rstrip(b'=')).decode('ascii')
+
+
+# HS256-only signature verifier; claims are parsed and checked in _fast_decode.
+_jws = PyJWS(algorithms=[ALGORITHM])
+
+
+def _fast_decode(token: str) -> dict:
+    """Verify an HS256 JWT signature and expiry, returning its payload."""
+    try:
+        payload = orjson.loads(_jws.decode(token, SECRET_KEY_BYTES, algorithms=[ALGORITHM]))
+    except orjson.JSONDecodeError:
+        raise jwt.DecodeError("Invalid payload string") from None
+    if not isinstance(payload, dict):
+        raise jwt.DecodeError("Invalid payload string: must be a json object")
+    if "exp" in payload:
+        try:
+            exp = int(payload["exp"])
+        except (ValueError, TypeError, OverflowError):
+            raise jwt.DecodeError("Expiration Time claim (exp) must be an integer.") from None
+        if exp <= time.time():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create JWT access token."""
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    now = int(time.time())
+    expire_seconds = int(expires_delta.total_seconds()) if expires_delta else ACCESS_TOKEN_EXPIRE_SECONDS
     to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),
+        "exp": now + expire_seconds,
+        "iat": now,
         "type": "access"
     })
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return _fast_encode(to_encode)
 
 
 def create_refresh_token(data: dict) -> str:
     """Create JWT refresh token."""
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    now = int(time.time())
     to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),
+        "exp": now + REFRESH_TOKEN_EXPIRE_SECONDS,
+        "iat": now,
         "type": "refresh"
     })
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return _fast_encode(to_encode)
+
+
+# Decoded payloads keyed by token digest. An entry lives for at most
+# DECODE_CACHE_TTL seconds and never past the token's own expiry.
+_decode_cache = SieveCache(
+    maxsize=10000,
+    ttu=lambda _key, payload, now: min(now + DECODE_CACHE_TTL, payload.get("exp", now)),
+    timer=time.time
+)
+_decode_cache_lock = threading.Lock()
 
 
 def decode_token(token: str) -> Optional[dict]:
-    """Decode and validate JWT token."""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    """Decode and validate JWT token, reusing recently verified payloads."""
+    key = hashlib.sha256(token.encode('utf-8')).digest()[:16]
+    with _decode_cache_lock:
+        payload = _decode_cache.get(key)
+    if payload is not None:
         return payload
+
+    try:
+        payload = _fast_decode(token)
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
 
+    with _decode_cache_lock:
+        _decode_cache[key] = payload
+    return payload
+
 
 # ===== User Authentication Functions =====
-def get_user_by_email(db_s: Session, email: str):
-    """Get user by email."""
-    from . import models
-    return db_s.query(models.User).filter(models.User.email == email).first()
+def get_user_by_email(db_s: Session, email: str, columns: Optional[tuple] = None):
+    """Get user by email, optionally loading only the given columns."""
+    query = db_s.query(models.User).filter(models.User.email == email)
+    if columns:
+        query = query.options(load_only(*columns))
+    return query.first()
 
 
 def create_user(db_s: Session, user_data: UserRegister):
     """Create a new user."""
-    from . import models
-    
     # Check if user already exists
     existing = get_user_by_email(db_s, user_data.email)
     if existing:
@@ -168,44 +295,109 @@ def create_user(db_s: Session, user_data: UserRegister):
     )
     db_s.add(user)
     db_s.commit()
-    db_s.refresh(user)
     return user
 
 
 def authenticate_user(db_s: Session, email: str, password: str):
     """Authenticate user with email and password."""
-    user = get_user_by_email(db_s, email)
-    if not user:
-        return None
-    if not user.password_hash:
+    user = get_user_by_email(db_s, email, columns=(
+        models.User.id, models.User.email, models.User.name, models.User.role,
+        models.User.phone, models.User.is_active, models.User.password_hash,
+        models.User.login_count
+    ))
+    if user is None or not user.password_hash:
+        # Burn the same hashing cost so unknown emails are not distinguishable by timing
+        verify_password(password, _DUMMY_HASH)
         return None
     if not verify_password(password, user.password_hash):
         return None
     if not user.is_active:
         return None
+    # Transparently migrate legacy PBKDF2 and bcrypt hashes on successful login
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+        db_s.commit()
     return user
 
 
+# ===== Current-User Cache =====
+@dataclass(frozen=True)
+class CurrentUser:
+    """Detached snapshot of the authenticated user's identity fields."""
+    id: int
+    email: str
+    name: str
+    role: str
+    phone: Optional[str]
+    is_active: bool
+
+
+_user_cache = TTLCache(maxsize=5000, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop a cached user snapshot after the user's identity fields change."""
+    with _user_cache_lock:
+        _user_cache.pop(int(user_id), None)
+
+
+def load_current_user(db_s: Session, user_id: int) -> Optional[CurrentUser]:
+    """Get an active user snapshot, querying the database only on cache miss."""
+    with _user_cache_lock:
+        snapshot = _user_cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+
+    user = db_s.scalar(
+        select(models.User)
+        .options(load_only(
+            models.User.id, models.User.email, models.User.name,
+            models.User.role, models.User.phone, models.User.is_active
+        ))
+        .where(models.User.id == user_id)
+    )
+    if not user or not user.is_active:
+        return None
+
+    snapshot = CurrentUser(
+        id=user.id,
+        email=user.email,
+        name=user.name,
+        role=user.role,
+        phone=user.phone,
+        is_active=user.is_active
+    )
+    with _user_cache_lock:
+        _user_cache[user_id] = snapshot
+    return snapshot
+
+
 # ===== Dependency Functions =====
 def get_db_session():
     yield from get_db()
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Extract the token from an `Authorization: Bearer <token>` header value."""
+    if authorization and authorization[:7].lower() == "bearer ":
+        return authorization[7:].strip() or None
+    return None
+
+
+def get_current_user(
+    authorization: Optional[str] = Depends(security),
     db_s: Session = Depends(get_db_session)
-):
+) -> CurrentUser:
     """Get current authenticated user from JWT token."""
-    from . import models
-    
-    if not credentials:
+    token = bearer_token(authorization)
+    if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"}
         )
     
-    token = credentials.credentials
     payload = decode_token(token)
     
     if not payload:
@@ -229,8 +421,8 @@ async def get_current_user(
             detail="Invalid token payload"
         )
     
-    user = db_s.get(models.User, int(user_id))
-    if not user or not user.is_active:
+    user = load_current_user(db_s, int(user_id))
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found or inactive"
@@ -239,17 +431,15 @@ async def get_current_user(
     return user
 
 
-async def get_current_user_optional(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
+def get_current_user_optional(
+    authorization: Optional[str] = Depends(security),
     db_s: Session = Depends(get_db_session)
-):
+) -> Optional[CurrentUser]:
     """Get current user if authenticated, otherwise return None."""
-    from . import models
-    
-    if not credentials:
+    token = bearer_token(authorization)
+    if not token:
         return None
     
-    token = credentials.credentials
     payload = decode_token(token)
     
     if not payload or payload.get("type") != "access":
@@ -259,11 +449,10 @@ async def get_current_user_optional(
     if not user_id:
         return None
     
-    user = db_s.get(models.User, int(user_id))
-    return user if user and user.is_active else None
+    return load_current_user(db_s, int(user_id))
 
 
-async def require_admin(user = Depends(get_current_user)):
+def require_admin(user = Depends(get_current_user)):
     """Require admin role for access."""
     if user.role != 'admin':
         raise HTTPException(
@@ -276,18 +465,16 @@ async def require_admin(user = Depends(get_current_user)):
 # ===== Token Generation Helper =====
 def generate_tokens(user) -> TokenResponse:
     """Generate access and refresh tokens for user."""
-    access_token = create_access_token(data={"sub": str(user.id)})
-    refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    claims = user.to_token_dict()
+    # RFC 7519 sub is a StringOrURI; readers convert it back with int()
+    access_token = create_access_token(data={"sub": str(claims["id"])})
+    refresh_token = create_refresh_token(data={"sub": str(claims["id"])})
     
-    return TokenResponse(
+    # All fields are produced internally, so skip pydantic validation
+    return TokenResponse.model_construct(
         access_token=access_token,
         refresh_token=refresh_token,
-        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        user={
-            "id": user.id,
-            "email": user.email,
-            "name": user.name,
-            "role": user.role,
-            "phone": user.phone
-        }
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_SECONDS,
+        user=claims
     )
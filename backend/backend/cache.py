@@ -0,0 +1,125 @@
+"""
+In-Process Cache Module for CourtBook Pro
+==========================================
+SIEVE-evicting cache with optional per-entry expiry. Hits only set a
+`visited` bit; eviction sweeps a hand from oldest to newest clearing
+bits until an unvisited entry is found, giving near-LRU hit rates with
+O(1) hits and resistance to one-shot keys such as fresh JWTs.
+Not thread-safe; callers guard it with their own lock.
+"""
+
+import time
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class _Node:
+    __slots__ = ('key', 'value', 'expires', 'visited', 'newer', 'older')
+
+    def __init__(self, key, value, expires):
+        self.key = key
+        self.value = value
+        self.expires = expires
+        self.visited = False
+        self.newer = None
+        self.older = None
+
+
+class SieveCache:
+    """Fixed-size mapping with SIEVE eviction and optional per-entry expiry."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttu: Optional[Callable[[Hashable, Any, float], float]] = None,
+        timer: Callable[[], float] = time.monotonic
+    ):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self._ttu = ttu
+        self._timer = timer
+        self._map = {}
+        self._head = None  # newest entry
+        self._tail = None  # oldest entry
+        self._hand = None
+
+    def __len__(self) -> int:
+        return len(self._map)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        expires = self._ttu(key, value, self._timer()) if self._ttu else None
+        node = self._map.get(key)
+        if node is not None:
+            node.value = value
+            node.expires = expires
+            node.visited = True
+            return
+        if len(self._map) >= self.maxsize:
+            self._evict()
+        node = _Node(key, value, expires)
+        node.older = self._head
+        if self._head is not None:
+            self._head.newer = node
+        self._head = node
+        if self._tail is None:
+            self._tail = node
+        self._map[key] = node
+
+    def get(self, key, default=None):
+        node = self._map.get(key)
+        if node is None:
+            return default
+        if self._expired(node, self._timer()):
+            self._unlink(node)
+            return default
+        node.visited = True
+        return node.value
+
+    def pop(self, key, default=None):
+        node = self._map.get(key)
+        if node is None:
+            return default
+        self._unlink(node)
+        return node.value
+
+    def clear(self) -> None:
+        self._map.clear()
+        self._head = self._tail = self._hand = None
+
+    def _expired(self, node: _Node, now: float) -> bool:
+        return node.expires is not None and node.expires <= now
+
+    def _evict(self) -> None:
+        """Sweep from the hand towards newer entries, dropping the first unvisited or expired one."""
+        now = self._timer()
+        node = self._hand or self._tail
+        while node.visited and not self._expired(node, now):
+            node.visited = False
+            node = node.newer or self._tail
+        self._hand = node.newer
+        self._unlink(node)
+
+    def _unlink(self, node: _Node) -> None:
+        if self._hand is node:
+            self._hand = node.newer
+        if node.newer is not None:
+            node.newer.older = node.older
+        else:
+            self._head = node.older
+        if node.older is not None:
+            node.older.newer = node.newer
+        else:
+            self._tail = node.newer
+        node.newer = node.older = None
+        del self._map[node.key]
@@ -1,5 +1,6 @@
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
 import os
 
 # Use SQLite by default for easy local development, or PostgreSQL if DATABASE_URL is set
@@ -10,7 +11,19 @@ connect_args = {}
 if DATABASE_URL.startswith('sqlite'):
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+if DATABASE_URL.startswith('sqlite') and (':memory:' in DATABASE_URL or DATABASE_URL.rstrip('/') == 'sqlite:'):
+    # In-memory SQLite lives in one connection; every thread must share it
+    pool_args = {'poolclass': StaticPool}
+else:
+    # QueuePool is explicit for shared-cache memory URIs, which SQLAlchemy would otherwise
+    # pin per thread; pre-ping drops dead connections. Sizing keeps SQLAlchemy's defaults
+    # (5 + 10 overflow, 30s timeout) unless overridden from the environment
+    pool_args = {'poolclass': QueuePool, 'pool_pre_ping': True}
+    for setting, env in (('pool_size', 'DB_POOL_SIZE'), ('max_overflow', 'DB_MAX_OVERFLOW'), ('pool_timeout', 'DB_POOL_TIMEOUT')):
+        if os.getenv(env):
+            pool_args[setting] = int(os.environ[env])
+
+engine = create_engine(DATABASE_URL, connect_args=connect_args, **pool_args)
 
 # Enable foreign keys for SQLite
 if DATABASE_URL.startswith('sqlite'):
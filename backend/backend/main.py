@@ -1,27 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import text
+from fastapi.responses import JSONResponse
+from sqlalchemy import func, insert, inspect, select, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from . import db, models, pricing
+from .cache import SieveCache
 from .auth import (
     UserRegister, UserLogin, TokenResponse, PasswordChange,
     create_user, authenticate_user, get_current_user, get_current_user_optional,
     require_admin, generate_tokens, decode_token, hash_password, verify_password,
-    create_access_token
+    create_access_token, invalidate_user
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
 import uvicorn
 import datetime
-import hashlib
 import json
 import asyncio
+import base64
+import contextlib
+import bisect
+import hashlib
+import logging
 import os
+import threading
+import time
+import orjson
+import redis
+from alembic import command
+from alembic.config import Config
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Set
+from typing import Optional, List, Set, Dict
+
+logger = logging.getLogger(__name__)
+
+class OrjsonResponse(JSONResponse):
+    """JSON response rendered with orjson; datetimes serialize natively."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
 
 app = FastAPI(
     title='CourtBook Pro API',
     description='Professional Court Booking Platform with AI-powered insights',
-    version='2.0.0'
+    version='2.0.0',
+    default_response_class=OrjsonResponse
 )
 
 # CORS Middleware - support production URLs
@@ -39,7 +62,7 @@ if extra_origins:
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=cors_origins,
+    allow_origins=frozenset(cors_origins),  # hashed membership check per request
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["*"],
@@ -50,20 +73,292 @@ def get_db_session():
     yield from db.get_db()
 
 
+# ===== Admin list cache =====
+# Near-static admin lists are served from pre-encoded bytes. Mutations bump the
+# version and drop the entry; the TTL bounds staleness across worker processes.
+LIST_CACHE_TTL = 30
+LIST_VERSIONS = {'courts': 0, 'coaches': 0, 'equipment': 0, 'rules': 0}
+_list_cache: Dict[str, tuple] = {}  # key -> (version, etag, body, expires)
+
+
+def cached_list(request: Request, key: str, build) -> Response:
+    """Serve a list endpoint from the cache, answering 304 when the ETag matches."""
+    version = LIST_VERSIONS[key]
+    entry = _list_cache.get(key)
+    if entry is None or entry[0] != version or entry[3] <= time.monotonic():
+        body = orjson.dumps(build(), option=orjson.OPT_NON_STR_KEYS)
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        entry = (version, etag, body, time.monotonic() + LIST_CACHE_TTL)
+        # A mutation committed mid-build already bumped the version; don't store stale bytes
+        if LIST_VERSIONS[key] == version:
+            _list_cache[key] = entry
+    etag = entry[1]
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(entry[2], media_type='application/json', headers={'ETag': etag})
+
+
+def bump_list_version(*keys: str):
+    """Invalidate cached admin lists after a mutation."""
+    for key in keys:
+        LIST_VERSIONS[key] += 1
+        _list_cache.pop(key, None)
+
+
+# ===== Shared Redis cache =====
+# Optional Redis shared by all workers; without REDIS_URL the dashboard and
+# recommendations are computed per request
+REDIS_URL = os.getenv('REDIS_URL')
+redis_client = redis.Redis.from_url(REDIS_URL, socket_timeout=0.5) if REDIS_URL else None
+DASHBOARD_CACHE_KEY = 'v1:analytics:dashboard'  # bump the prefix when the payload shape changes
+DASHBOARD_CACHE_TTL = 45
+
+
+def invalidate_dashboard():
+    """Drop the cached dashboard after a booking or waitlist change."""
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(DASHBOARD_CACHE_KEY)
+    except redis.RedisError:
+        pass  # the TTL still bounds staleness
+
+
+RECO_CACHE_TTL = 600
+
+
+def reco_cache_key(target_date: datetime.date, user_email: str | None) -> str:
+    return f"v1:reco:{target_date.isoformat()}:{user_email or ''}"
+
+
+def reco_user_keys(user_email: str) -> str:
+    """Set of the cached recommendation keys belonging to one user."""
+    return f"v1:reco-keys:{user_email}"
+
+
+def invalidate_recommendations(user_email: str | None):
+    """Drop every cached recommendation date for a user after their bookings change."""
+    if redis_client is None or not user_email:
+        return
+    # Tracked in a set because the booking date says nothing about which dates were viewed
+    keys_key = reco_user_keys(user_email)
+    try:
+        keys = redis_client.smembers(keys_key)
+        redis_client.delete(keys_key, *keys)
+    except redis.RedisError:
+        pass
+
+
+# ===== Read-path response cache =====
+# Slot and availability bodies are keyed by their inputs plus the versions of
+# everything they read, so a bump makes old entries unreachable and SIEVE
+# evicts them. The short TTL bounds staleness across worker processes.
+RESPONSE_CACHE_TTL = 5
+BOOKING_VERSIONS: Dict[str, int] = {}  # ISO date -> bumped on booking changes; past dates pruned daily
+# Reported for dates missing from BOOKING_VERSIONS. Never below a pruned
+# date's last version, so keys cached before pruning stay unreachable.
+_booking_version_floor = 0
+_booking_versions_pruned_on = None  # ISO date of the last prune
+_response_cache = SieveCache(
+    maxsize=1024,
+    ttu=lambda _key, _body, now: now + RESPONSE_CACHE_TTL
+)
+_response_cache_lock = threading.Lock()
+
+
+def window_dates(start_ts: datetime.datetime, end_ts: datetime.datetime) -> List[str]:
+    """ISO dates touched by a time window."""
+    first = start_ts.date()
+    return [(first + datetime.timedelta(days=i)).isoformat() for i in range((end_ts.date() - first).days + 1)]
+
+
+def booking_version(day: str) -> int:
+    return BOOKING_VERSIONS.get(day, _booking_version_floor)
+
+
+def prune_booking_versions(today: str):
+    """Drop versions of dates before today so the map stays bounded in a long-lived worker."""
+    global _booking_version_floor, _booking_versions_pruned_on
+    for day in [d for d in BOOKING_VERSIONS if d < today]:
+        _booking_version_floor = max(_booking_version_floor, BOOKING_VERSIONS.pop(day))
+    _booking_versions_pruned_on = today
+
+
+def bump_booking_version(start_ts: datetime.datetime, end_ts: datetime.datetime):
+    """Invalidate cached availability for every date a booking touches."""
+    today = datetime.datetime.utcnow().date().isoformat()
+    if _booking_versions_pruned_on != today:
+        prune_booking_versions(today)
+    for day in window_dates(start_ts, end_ts):
+        BOOKING_VERSIONS[day] = booking_version(day) + 1
+
+
+def cached_response(key: tuple, build) -> Response:
+    """Serve pre-encoded JSON for key, building and storing it on a miss."""
+    with _response_cache_lock:
+        body = _response_cache.get(key)
+    if body is None:
+        body = orjson.dumps(build(), option=orjson.OPT_NON_STR_KEYS)
+        with _response_cache_lock:
+            _response_cache[key] = body
+    return Response(body, media_type='application/json')
+
+
 # ===== Auto-seed database on startup =====
 @app.on_event("startup")
 async def startup_event():
     """Initialize database and seed data on startup."""
-    from .models import Base, Court, User
-    
-    # Create tables
-    Base.metadata.create_all(bind=db.engine)
-    
-    # Check if data already exists
-    session = db.SessionLocal()
+    # Schema setup and seeding (which hashes passwords) block; run them in a thread
+    global stats_refresh_task
+    await asyncio.to_thread(init_database)
+    if USE_STATS_VIEW:
+        stats_refresh_task = asyncio.create_task(refresh_booking_stats_periodically())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the stats refresh loop, releasing its lock for another worker."""
+    if stats_refresh_task is not None:
+        stats_refresh_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await stats_refresh_task
+
+
+# Dashboard roll-ups read from mv_booking_stats on PostgreSQL, refreshed on this interval
+USE_STATS_VIEW = db.engine.dialect.name == 'postgresql'
+STATS_REFRESH_SECONDS = 300
+# Arbitrary advisory lock key; the worker holding it is the one that refreshes
+STATS_REFRESH_LOCK_KEY = 4_172_002
+stats_refresh_task: Optional[asyncio.Task] = None
+
+
+def hours_between(start, end):
+    """SQL expression for the hours between two timestamp columns."""
+    if db.engine.dialect.name == 'postgresql':
+        return func.extract('epoch', end - start) / 3600.0
+    return (func.julianday(end) - func.julianday(start)) * 24.0
+
+
+def server_timestamp(value: datetime.datetime):
+    """Bind a datetime so it compares exactly against server-stamped columns."""
+    if db.engine.dialect.name == 'sqlite':
+        # CURRENT_TIMESTAMP text has no fractional seconds, unlike bound datetimes
+        return func.datetime(value)
+    return value
+
+
+def acquire_stats_refresh_lock():
+    """
+    Return a connection holding the stats refresh lock, or None when another
+    worker holds it. The session-level lock lives as long as the connection.
+    """
+    conn = db.engine.connect()
+    try:
+        acquired = conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {'key': STATS_REFRESH_LOCK_KEY}
+        ).scalar()
+        conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    if not acquired:
+        conn.close()
+        return None
+    return conn
+
+
+def release_stats_refresh_lock(conn):
+    """Discard the lock holder's connection; closing the DBAPI connection drops the lock."""
+    conn.invalidate()
+    conn.close()
+
+
+def refresh_booking_stats(conn):
+    """Recompute mv_booking_stats without blocking dashboard readers."""
+    conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_booking_stats"))
+    conn.commit()
+
+
+async def refresh_booking_stats_periodically():
+    """Refresh the stats view from whichever worker holds the refresh lock."""
+    conn = None
+    try:
+        while True:
+            await asyncio.sleep(STATS_REFRESH_SECONDS)
+            try:
+                if conn is None:
+                    # Workers that lose the race retry, taking over if the holder exits
+                    conn = await asyncio.to_thread(acquire_stats_refresh_lock)
+                    if conn is None:
+                        continue
+                await asyncio.to_thread(refresh_booking_stats, conn)
+            except Exception:
+                logger.exception("Booking stats refresh failed")
+                if conn is not None:
+                    release_stats_refresh_lock(conn)
+                    conn = None
+    finally:
+        if conn is not None:
+            release_stats_refresh_lock(conn)
+
+
+# Arbitrary advisory lock key for schema setup on PostgreSQL
+INIT_LOCK_KEY = 4_172_001
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alembic.ini')
+
+
+def migrate_database(conn, fresh: bool):
+    """Upgrade an existing schema to the latest migration, or mark a new one as current."""
+    config = Config(ALEMBIC_INI)
+    config.attributes['connection'] = conn
+    if fresh:
+        command.stamp(config, 'head')
+    else:
+        command.upgrade(config, 'head')
+
+
+def init_database():
+    """Create tables and seed them when empty, one worker at a time."""
+    with db.engine.connect() as conn:
+        # Workers start together: the first to take the lock creates and seeds,
+        # the others wait for it and then find the data
+        if conn.dialect.name == 'postgresql':
+            # Session-level, so it outlasts the commits of migrations that build
+            # indexes concurrently; released explicitly below
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': INIT_LOCK_KEY})
+            conn.commit()
+            try:
+                setup_schema_and_seed(conn)
+            except BaseException:
+                conn.invalidate()  # ending the database session drops its lock
+                raise
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': INIT_LOCK_KEY})
+            conn.commit()
+        else:
+            if conn.dialect.name == 'sqlite':
+                conn.exec_driver_sql("BEGIN IMMEDIATE")  # takes the database write lock up front
+            setup_schema_and_seed(conn)
+
+
+def setup_schema_and_seed(conn):
+    """Migrate, create and seed through a connection that holds the init lock."""
+    from .models import Base
+    
+    # Migrate tables that predate a model change, then create any missing ones
+    fresh = not inspect(conn).has_table('courts')
+    if not fresh:
+        if conn.dialect.name == 'postgresql':
+            conn.commit()  # migrations manage their own transactions here
+        migrate_database(conn, fresh=False)
+    Base.metadata.create_all(bind=conn)
+    if fresh:
+        migrate_database(conn, fresh=True)
+    
+    # Check if data already exists without hydrating a Court object
+    session = Session(bind=conn)  # joins the connection's transaction; conn.commit() ends it
     try:
-        existing_courts = session.query(Court).first()
-        if not existing_courts:
+        seeded = session.execute(text("SELECT 1 FROM courts LIMIT 1")).first()
+        if seeded is None:
             print("🌱 Seeding database...")
             seed_database(session)
             print("✅ Database seeded successfully!")
@@ -71,83 +366,63 @@ async def startup_event():
             print("✅ Database already seeded")
     finally:
         session.close()
+    conn.commit()
 
 
 def seed_database(db_session):
-    """Seed the database with initial data."""
+    """Seed the database with initial data using one bulk insert per table."""
     from .models import Court, EquipmentItem, Coach, PricingRule, CoachAvailability, User
     from .auth import hash_password
-    
-    # Create admin user
-    admin = User(
-        name='Admin User',
-        email='admin@courtbook.com',
-        phone='+1234567890',
-        password_hash=hash_password('Admin123!'),
-        role='admin',
-        is_active=True,
-        email_verified=True
-    )
-    db_session.add(admin)
-    
-    # Create demo customer user
-    demo = User(
-        name='Demo User',
-        email='demo@courtbook.com',
-        phone='+1987654321',
-        password_hash=hash_password('Demo123!'),
-        role='customer',
-        is_active=True,
-        email_verified=True
-    )
-    db_session.add(demo)
+
+    # Admin and demo customer users
+    db_session.execute(insert(User), [
+        {
+            'name': 'Admin User', 'email': 'admin@courtbook.com', 'phone': '+1234567890',
+            'password_hash': hash_password('Admin123!'), 'role': 'admin',
+            'is_active': True, 'email_verified': True
+        },
+        {
+            'name': 'Demo User', 'email': 'demo@courtbook.com', 'phone': '+1987654321',
+            'password_hash': hash_password('Demo123!'), 'role': 'customer',
+            'is_active': True, 'email_verified': True
+        }
+    ])
 
     # Courts
-    courts_data = [
+    db_session.execute(insert(Court), [
         {'name': 'Court 1 (Indoor)', 'type': 'indoor', 'base_hourly': 600},
         {'name': 'Court 2 (Indoor)', 'type': 'indoor', 'base_hourly': 600},
         {'name': 'Court 3 (Outdoor)', 'type': 'outdoor', 'base_hourly': 400},
         {'name': 'Court 4 (Outdoor)', 'type': 'outdoor', 'base_hourly': 400},
-    ]
-    for c in courts_data:
-        db_session.add(Court(name=c['name'], type=c['type'], base_hourly=c['base_hourly']))
+    ])
 
     # Equipment
-    equipment_data = [
+    db_session.execute(insert(EquipmentItem), [
         {'sku': 'racket', 'name': 'Badminton Racket', 'total_quantity': 10},
         {'sku': 'shoes', 'name': 'Court Shoes', 'total_quantity': 8},
         {'sku': 'shuttlecock', 'name': 'Shuttlecock (Pack of 6)', 'total_quantity': 20}
-    ]
-    for e in equipment_data:
-        db_session.add(EquipmentItem(sku=e['sku'], name=e['name'], total_quantity=e['total_quantity']))
-
-    # Coaches
-    coaches_data = [
-        {'name': 'Coach Alex', 'hourly_rate': 300},
-        {'name': 'Coach Sarah', 'hourly_rate': 250},
-        {'name': 'Coach Mike', 'hourly_rate': 200}
-    ]
-    coaches = []
-    for c in coaches_data:
-        coach = Coach(name=c['name'], hourly_rate=c['hourly_rate'])
-        db_session.add(coach)
-        coaches.append(coach)
-    
-    db_session.flush()  # Get coach IDs
-    
+    ])
+
+    # Coaches; RETURNING hands back the ids needed for availability rows
+    coach_ids = db_session.scalars(
+        insert(Coach).returning(Coach.id, sort_by_parameter_order=True),
+        [
+            {'name': 'Coach Alex', 'hourly_rate': 300},
+            {'name': 'Coach Sarah', 'hourly_rate': 250},
+            {'name': 'Coach Mike', 'hourly_rate': 200}
+        ]
+    ).all()
+
     # Coach availability (Mon-Sat, 8am-8pm)
     days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
-    for coach in coaches:
-        for day in days:
-            db_session.add(CoachAvailability(
-                coach_id=coach.id,
-                day_of_week=day,
-                start_time='08:00',
-                end_time='20:00'
-            ))
+    db_session.execute(insert(CoachAvailability), [
+        {'coach_id': coach_id, 'day_of_week': day, 'start_time': '08:00', 'end_time': '20:00'}
+        for coach_id in coach_ids
+        for day in days
+    ])
 
     # Pricing rules
-    rules_data = [
+    db_session.execute(insert(PricingRule), [
         {
             'name': 'Peak Hours (6-9 PM)', 'enabled': True, 'priority': 10,
             'rule_json': {'match': {'start': '18:00', 'end': '21:00', 'days': ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']}, 'modifier': {'type': 'percentage', 'value': 20}},
@@ -163,11 +438,10 @@ def seed_database(db_session):
             'rule_json': {'match': {}, 'applies_to': 'indoor', 'modifier': {'type': 'percentage', 'value': 25}},
             'applies_to': 'court'
         }
-    ]
-    for r in rules_data:
-        db_session.add(PricingRule(name=r['name'], enabled=r['enabled'], priority=r['priority'], rule_json=r['rule_json'], applies_to=r['applies_to']))
+    ])
 
     db_session.commit()
+    pricing.invalidate_rules()  # Core inserts bypass the ORM change tracking
 
 
 # ===== WebSocket Connection Manager =====
@@ -175,43 +449,49 @@ class ConnectionManager:
     """Manages WebSocket connections for real-time updates."""
     
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.subscriptions: dict = {}  # date -> set of websockets
+        self.active_connections: Set[WebSocket] = set()
+        self.subscriptions: Dict[str, Set[WebSocket]] = {}  # date -> set of websockets
+        self.ws_dates: Dict[WebSocket, Set[str]] = {}  # websocket -> subscribed dates
     
     async def connect(self, websocket: WebSocket, date: str = None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
         if date:
-            if date not in self.subscriptions:
-                self.subscriptions[date] = set()
-            self.subscriptions[date].add(websocket)
+            self.subscriptions.setdefault(date, set()).add(websocket)
+            self.ws_dates.setdefault(websocket, set()).add(date)
     
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        # Remove from all subscriptions
-        for date in list(self.subscriptions.keys()):
-            if websocket in self.subscriptions[date]:
-                self.subscriptions[date].remove(websocket)
-            if not self.subscriptions[date]:
+        self.active_connections.discard(websocket)
+        # Only visit the dates this socket subscribed to
+        for date in self.ws_dates.pop(websocket, ()):
+            subscribers = self.subscriptions.get(date)
+            if subscribers is None:
+                continue
+            subscribers.discard(websocket)
+            if not subscribers:
                 del self.subscriptions[date]
     
+    async def _fan_out(self, connections, message: dict):
+        """Send one pre-encoded message to all connections concurrently, dropping failed sockets."""
+        connections = list(connections)
+        if not connections:
+            return
+        payload = orjson.dumps(message).decode()
+        results = await asyncio.gather(
+            *(connection.send_text(payload) for connection in connections),
+            return_exceptions=True
+        )
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(connection)
+    
     async def broadcast(self, message: dict):
         """Broadcast to all connected clients."""
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+        await self._fan_out(self.active_connections, message)
     
     async def broadcast_to_date(self, date: str, message: dict):
         """Broadcast to clients subscribed to a specific date."""
-        if date in self.subscriptions:
-            for connection in self.subscriptions[date]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    pass
+        await self._fan_out(self.subscriptions.get(date, ()), message)
 
 manager = ConnectionManager()
 
@@ -290,8 +570,16 @@ def refresh_token(refresh_token: str, db_s: Session = Depends(get_db_session)):
 
 
 @app.get('/api/auth/me', tags=['Authentication'])
-async def get_me(user = Depends(get_current_user)):
+def get_me(current_user = Depends(get_current_user), db_s: Session = Depends(get_db_session)):
     """Get current authenticated user."""
+    # Columns only: the response is plain data, no ORM instance needed
+    user = db_s.execute(
+        select(
+            models.User.id, models.User.email, models.User.name, models.User.role,
+            models.User.phone, models.User.avatar_url, models.User.email_verified,
+            models.User.preferences, models.User.login_count, models.User.created_at
+        ).where(models.User.id == current_user.id)
+    ).one()
     return {
         "id": user.id,
         "email": user.email,
@@ -307,15 +595,16 @@ async def get_me(user = Depends(get_current_user)):
 
 
 @app.put('/api/auth/me', tags=['Authentication'])
-async def update_profile(
+def update_profile(
     name: Optional[str] = None,
     phone: Optional[str] = None,
     avatar_url: Optional[str] = None,
     preferences: Optional[dict] = None,
-    user = Depends(get_current_user),
+    current_user = Depends(get_current_user),
     db_s: Session = Depends(get_db_session)
 ):
     """Update current user's profile."""
+    user = db_s.get(models.User, current_user.id)
     if name:
         user.name = name
     if phone is not None:
@@ -326,16 +615,19 @@ async def update_profile(
         user.preferences = preferences
     
     db_s.commit()
+    invalidate_user(user.id)
     return {"status": "updated"}
 
 
 @app.post('/api/auth/change-password', tags=['Authentication'])
-async def change_password(
+def change_password(
     data: PasswordChange,
-    user = Depends(get_current_user),
+    current_user = Depends(get_current_user),
     db_s: Session = Depends(get_db_session)
 ):
     """Change user's password."""
+    # A plain def runs in the threadpool, so the lookup and argon2 stay off the event loop
+    user = db_s.get(models.User, current_user.id)
     if not verify_password(data.old_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -360,8 +652,18 @@ class BookingRequest(BaseModel):
 def seed(db_s: Session = Depends(get_db_session)):
     from ..seed import seed_data
     seed_data(db_s)
+    bump_list_version(*LIST_VERSIONS)
     return {'status':'seeded'}
 
+# CoachAvailability.day_of_week names, indexed by date.weekday()
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+# Time-of-day halves of the 30 min slot grid (08:00-21:00), formatted once
+SLOT_TEMPLATES = [
+    (datetime.time(8 + i // 2, 30 * (i % 2)).isoformat(), datetime.time(8 + (i + 1) // 2, 30 * ((i + 1) % 2)).isoformat())
+    for i in range(26)
+]
+
 @app.get('/api/slots/{date_str}')
 def get_slots_for_date(date_str: str, db_s: Session = Depends(get_db_session)):
     """Return available courts and coaches for a given date (ISO format)."""
@@ -370,49 +672,60 @@ def get_slots_for_date(date_str: str, db_s: Session = Depends(get_db_session)):
     except ValueError:
         raise HTTPException(status_code=400, detail='Invalid date format (use ISO)')
     
-    courts = db_s.query(models.Court).filter(models.Court.enabled == True).all()
-    coaches = db_s.query(models.Coach).filter(models.Coach.active == True).all()
+    day = date.isoformat()
     
-    # Generate 30 min slots for the day
-    slots = []
-    start = datetime.datetime.combine(date, datetime.time(8, 0))
-    end = datetime.datetime.combine(date, datetime.time(21, 0))
-    current = start
-    while current < end:
-        next_slot = current + datetime.timedelta(minutes=30)
-        slots.append({'start': current.isoformat(), 'end': next_slot.isoformat()})
-        current = next_slot
+    def build():
+        courts = db_s.query(models.Court).filter(models.Court.enabled == True).all()
+        coaches = db_s.query(models.Coach).filter(models.Coach.active == True).all()
+        slots = [{'start': f'{day}T{start}', 'end': f'{day}T{end}'} for start, end in SLOT_TEMPLATES]
+        return {'date': day, 'courts': [{'id': c.id, 'name': c.name, 'type': c.type.value} for c in courts], 'slots': slots, 'coaches': [{'id': co.id, 'name': co.name, 'hourly_rate': co.hourly_rate} for co in coaches]}
     
-    return {'date': str(date), 'courts': [{'id': c.id, 'name': c.name, 'type': c.type.value} for c in courts], 'slots': slots, 'coaches': [{'id': co.id, 'name': co.name, 'hourly_rate': co.hourly_rate} for co in coaches]}
+    return cached_response(('slots', day, LIST_VERSIONS['courts'], LIST_VERSIONS['coaches']), build)
+
+def overlapping_allocations(db_s: Session, start_ts: datetime.datetime, end_ts: datetime.datetime, resource_type: str):
+    """Query allocations of a resource type held by confirmed bookings overlapping a window."""
+    return db_s.query(models.BookingAllocation).join(models.Booking).filter(
+        models.Booking.status == 'confirmed',
+        models.Booking.start_ts < end_ts,
+        models.Booking.end_ts > start_ts,
+        models.BookingAllocation.resource_type == resource_type
+    )
 
 @app.get('/api/availability')
 def get_availability(start_ts: datetime.datetime, end_ts: datetime.datetime, court_type: str | None = None, db_s: Session = Depends(get_db_session)):
     """Check which courts/equipment/coaches are available for a time window."""
-    courts = db_s.query(models.Court).filter(models.Court.enabled == True)
-    if court_type:
-        courts = courts.filter(models.Court.type == court_type)
-    courts = courts.all()
-    
-    available = []
-    for court in courts:
-        overlapping = db_s.query(models.Booking).filter(
-            models.Booking.start_ts < end_ts,
-            models.Booking.end_ts > start_ts,
-            models.Booking.status == 'confirmed'
-        ).all()
-        is_booked = False
-        for b in overlapping:
-            for alloc in b.allocations:
-                if alloc.resource_type == 'court' and alloc.resource_id == court.id:
-                    is_booked = True
-                    break
-        if not is_booked:
-            available.append({'court_id': court.id, 'name': court.name, 'type': court.type.value})
-    
-    equipment = db_s.query(models.EquipmentItem).filter(models.EquipmentItem.active == True).all()
-    coaches = db_s.query(models.Coach).filter(models.Coach.active == True).all()
-    
-    return {'available_courts': available, 'equipment': [{'sku': e.sku, 'name': e.name, 'available_qty': e.total_quantity} for e in equipment], 'coaches': [{'id': c.id, 'name': c.name} for c in coaches]}
+    def build():
+        courts = db_s.query(models.Court).filter(models.Court.enabled == True)
+        if court_type:
+            courts = courts.filter(models.Court.type == court_type)
+        courts = courts.all()
+        
+        # One query for every court with a confirmed booking overlapping the window
+        booked_court_ids = {
+            row[0] for row in overlapping_allocations(db_s, start_ts, end_ts, 'court')
+            .with_entities(models.BookingAllocation.resource_id).distinct()
+        }
+        
+        available = [
+            {'court_id': court.id, 'name': court.name, 'type': court.type.value}
+            for court in courts if court.id not in booked_court_ids
+        ]
+        
+        equipment = db_s.query(models.EquipmentItem).filter(models.EquipmentItem.active == True).all()
+        coaches = db_s.query(models.Coach).filter(models.Coach.active == True).all()
+        
+        return {'available_courts': available, 'equipment': [{'sku': e.sku, 'name': e.name, 'available_qty': e.total_quantity} for e in equipment], 'coaches': [{'id': c.id, 'name': c.name} for c in coaches]}
+    
+    dates = window_dates(start_ts, end_ts)
+    if len(dates) > 2:
+        # Multi-day windows are rare; not worth a key per touched date
+        return OrjsonResponse(build())
+    key = (
+        'availability', start_ts, end_ts, court_type,
+        LIST_VERSIONS['courts'], LIST_VERSIONS['coaches'], LIST_VERSIONS['equipment'],
+        tuple(booking_version(day) for day in dates)
+    )
+    return cached_response(key, build)
 
 @app.get('/api/simulate-pricing')
 def simulate_pricing(start_ts: datetime.datetime, end_ts: datetime.datetime, court_id: int, db_s: Session = Depends(get_db_session)):
@@ -422,15 +735,45 @@ def simulate_pricing(start_ts: datetime.datetime, end_ts: datetime.datetime, cou
     result = pricing.compute_price(db_s, court, start_ts, end_ts)
     return result
 
+def booking_user_id(db_s: Session, email: str) -> int:
+    """Id of the user booking under email, creating a bare account if needed."""
+    user_id = db_s.execute(select(models.User.id).where(models.User.email == email)).scalar()
+    if user_id is None:
+        user = models.User(name=email.split('@')[0], email=email)
+        db_s.add(user)
+        db_s.flush()  # assigns user.id; the row commits with the booking or waitlist entry
+        user_id = user.id
+    return user_id
+
+def lock_court(db_s: Session, court_id: int):
+    """
+    Serialize bookings of a court until commit: PostgreSQL holds the court's
+    row lock, SQLite takes its database write lock. Keeps the overlap check
+    sound where the no_double_booking constraint does not exist.
+    """
+    db_s.execute(
+        update(models.Court).where(models.Court.id == court_id).values(enabled=models.Court.enabled),
+        execution_options={'synchronize_session': False}
+    )
+
+def violates(error: IntegrityError, constraint: str) -> bool:
+    """Whether an IntegrityError was raised by the named constraint (reported by psycopg2)."""
+    return getattr(getattr(error.orig, 'diag', None), 'constraint_name', None) == constraint
+
+def add_to_waitlist(db_s: Session, req: BookingRequest, user_id: int) -> dict:
+    """Queue the user for the requested court slot and commit."""
+    w = models.WaitlistEntry(court_id=req.court_id, start_ts=req.start_ts, end_ts=req.end_ts, user_id=user_id)
+    db_s.add(w)
+    db_s.flush()
+    waitlist_id = w.id  # read before commit expires the instance
+    db_s.commit()
+    invalidate_dashboard()
+    return {'status': 'waitlisted', 'waitlist_id': waitlist_id, 'message': 'Added to waitlist for this slot'}
+
 @app.post('/api/bookings')
 def create_booking(req: BookingRequest, db_s: Session = Depends(get_db_session)):
     """Atomically book court + equipment + coach with idempotency."""
-    user = db_s.query(models.User).filter(models.User.email == req.user_email).first()
-    if not user:
-        user = models.User(name=req.user_email.split('@')[0], email=req.user_email)
-        db_s.add(user)
-        db_s.commit()
-        db_s.refresh(user)
+    user_id = booking_user_id(db_s, req.user_email)
     
     court = db_s.get(models.Court, req.court_id)
     if not court or not court.enabled:
@@ -441,47 +784,39 @@ def create_booking(req: BookingRequest, db_s: Session = Depends(get_db_session))
     
     price = pricing.compute_price(db_s, court, req.start_ts, req.end_ts, req.equipment, coach)
     
-    slot_hash = f"{req.start_ts.isoformat()}_{req.end_ts.isoformat()}_{req.court_id}"
-    lock_id = int(hashlib.md5(slot_hash.encode()).hexdigest()[:8], 16)
-    
-    try:
-        db_s.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": lock_id})
-    except Exception as e:
-        print(f"Advisory lock warning: {e}")
-    
-    overlapping = db_s.query(models.Booking).filter(
-        models.Booking.start_ts < req.end_ts,
-        models.Booking.end_ts > req.start_ts,
-        models.Booking.status == 'confirmed'
-    ).all()
-    
-    for b in overlapping:
-        for alloc in b.allocations:
-            if alloc.resource_type == 'court' and alloc.resource_id == req.court_id:
-                w = models.WaitlistEntry(slot_hash=slot_hash, user_id=user.id)
-                db_s.add(w)
-                db_s.commit()
-                db_s.refresh(w)
-                return {'status': 'waitlisted', 'waitlist_id': w.id, 'message': 'Added to waitlist for this slot'}
+    lock_court(db_s, req.court_id)
+    court_taken = db_s.query(
+        overlapping_allocations(db_s, req.start_ts, req.end_ts, 'court')
+        .filter(models.BookingAllocation.resource_id == req.court_id).exists()
+    ).scalar()
+    if court_taken:
+        return add_to_waitlist(db_s, req, user_id)
     
     # ===== Equipment availability validation =====
-    for e in req.equipment:
-        sku = e.get('sku')
-        requested_qty = e.get('quantity', 1)
-        equipment_item = db_s.query(models.EquipmentItem).filter(models.EquipmentItem.sku == sku).first()
-        if not equipment_item or not equipment_item.active:
-            raise HTTPException(status_code=400, detail=f'Equipment {sku} not available')
-        
-        # Count already booked equipment for overlapping time slots
-        booked_qty = 0
-        for b in overlapping:
-            for alloc in b.allocations:
-                if alloc.resource_type == 'equipment' and alloc.resource_id == sku:
-                    booked_qty += alloc.quantity
+    if req.equipment:
+        skus = [e.get('sku') for e in req.equipment]
+        equipment_items = {
+            item.sku: item
+            for item in db_s.query(models.EquipmentItem).filter(models.EquipmentItem.sku.in_(skus))
+        }
+        # Quantity of each requested sku already held by overlapping confirmed bookings
+        booked = dict(
+            overlapping_allocations(db_s, req.start_ts, req.end_ts, 'equipment')
+            .filter(models.BookingAllocation.resource_id.in_(skus))
+            .with_entities(models.BookingAllocation.resource_id, func.sum(models.BookingAllocation.quantity))
+            .group_by(models.BookingAllocation.resource_id)
+        )
         
-        available_qty = equipment_item.total_quantity - booked_qty
-        if requested_qty > available_qty:
-            raise HTTPException(status_code=400, detail=f'Insufficient {sku} availability. Requested: {requested_qty}, Available: {available_qty}')
+        for e in req.equipment:
+            sku = e.get('sku')
+            requested_qty = e.get('quantity', 1)
+            equipment_item = equipment_items.get(sku)
+            if not equipment_item or not equipment_item.active:
+                raise HTTPException(status_code=400, detail=f'Equipment {sku} not available')
+            
+            available_qty = equipment_item.total_quantity - (booked.get(sku) or 0)
+            if requested_qty > available_qty:
+                raise HTTPException(status_code=400, detail=f'Insufficient {sku} availability. Requested: {requested_qty}, Available: {available_qty}')
     
     # ===== Coach availability validation =====
     if req.coach_id:
@@ -490,15 +825,18 @@ def create_booking(req: BookingRequest, db_s: Session = Depends(get_db_session))
             raise HTTPException(status_code=400, detail='Coach not available')
         
         # Check if coach is already booked for overlapping time
-        for b in overlapping:
-            for alloc in b.allocations:
-                if alloc.resource_type == 'coach' and alloc.resource_id == req.coach_id:
-                    raise HTTPException(status_code=400, detail='Coach already booked for this time slot')
+        coach_taken = db_s.query(
+            overlapping_allocations(db_s, req.start_ts, req.end_ts, 'coach')
+            .filter(models.BookingAllocation.resource_id == req.coach_id).exists()
+        ).scalar()
+        if coach_taken:
+            raise HTTPException(status_code=400, detail='Coach already booked for this time slot')
         
         # Check coach availability schedule
-        booking_day = req.start_ts.strftime('%A').lower()
-        booking_start_time = req.start_ts.strftime('%H:%M')
-        booking_end_time = req.end_ts.strftime('%H:%M')
+        booking_day = WEEKDAYS[req.start_ts.weekday()]
+        # 'HH:MM' to compare against the stored schedule strings
+        booking_start_time = req.start_ts.time().isoformat('minutes')
+        booking_end_time = req.end_ts.time().isoformat('minutes')
         
         coach_availability = db_s.query(models.CoachAvailability).filter(
             models.CoachAvailability.coach_id == req.coach_id,
@@ -512,7 +850,8 @@ def create_booking(req: BookingRequest, db_s: Session = Depends(get_db_session))
             raise HTTPException(status_code=400, detail=f'Coach availability is {coach_availability.start_time}-{coach_availability.end_time} on {booking_day}')
     
     booking = models.Booking(
-        user_id=user.id,
+        user_id=user_id,
+        court_id=req.court_id,
         start_ts=req.start_ts,
         end_ts=req.end_ts,
         status='confirmed',
@@ -520,69 +859,89 @@ def create_booking(req: BookingRequest, db_s: Session = Depends(get_db_session))
         pricing_snapshot=price
     )
     db_s.add(booking)
-    db_s.flush()
-    
-    alloc = models.BookingAllocation(booking_id=booking.id, resource_type='court', resource_id=req.court_id, quantity=1)
+    try:
+        db_s.flush()
+    except IntegrityError as e:
+        if not violates(e, 'no_double_booking'):
+            raise
+        # A concurrent request confirmed this slot after our check
+        db_s.rollback()
+        return add_to_waitlist(db_s, req, booking_user_id(db_s, req.user_email))
+    booking_id = booking.id
+    
+    alloc = models.BookingAllocation(booking_id=booking_id, resource_type='court', resource_id=req.court_id, quantity=1)
     db_s.add(alloc)
     
     for e in req.equipment:
-        ea = models.BookingAllocation(booking_id=booking.id, resource_type='equipment', resource_id=e.get('sku'), quantity=e.get('quantity', 1))
+        ea = models.BookingAllocation(booking_id=booking_id, resource_type='equipment', resource_id=e.get('sku'), quantity=e.get('quantity', 1))
         db_s.add(ea)
     
     if req.coach_id:
-        ca = models.BookingAllocation(booking_id=booking.id, resource_type='coach', resource_id=req.coach_id, quantity=1)
+        ca = models.BookingAllocation(booking_id=booking_id, resource_type='coach', resource_id=req.coach_id, quantity=1)
         db_s.add(ca)
     
-    db_s.commit()
-    db_s.refresh(booking)
-    
-    audit = models.AuditEvent(booking_id=booking.id, event_type='confirmed', payload={'user_email': req.user_email})
+    audit = models.AuditEvent(booking_id=booking_id, event_type='confirmed', payload={'user_email': req.user_email})
     db_s.add(audit)
     db_s.commit()
+    bump_booking_version(req.start_ts, req.end_ts)
+    invalidate_dashboard()
+    invalidate_recommendations(req.user_email)
     
-    return {'status': 'confirmed', 'booking_id': booking.id, 'total': price['total'], 'pricing': price}
+    return {'status': 'confirmed', 'booking_id': booking_id, 'total': price['total'], 'pricing': price}
 
 @app.get('/api/bookings/{booking_id}')
 def get_booking(booking_id: int, db_s: Session = Depends(get_db_session)):
     """Fetch booking details."""
-    booking = db_s.get(models.Booking, booking_id)
-    if not booking:
+    # Plain column read: no ORM instance or relationship state to build
+    row = db_s.execute(
+        select(
+            models.Booking.id, models.Booking.user_id, models.Booking.start_ts, models.Booking.end_ts,
+            models.Booking.status, models.Booking.total_price, models.Booking.pricing_snapshot,
+            models.Booking.created_at
+        ).where(models.Booking.id == booking_id)
+    ).one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail='booking not found')
-    return {
-        'id': booking.id,
-        'user_id': booking.user_id,
-        'start_ts': booking.start_ts,
-        'end_ts': booking.end_ts,
-        'status': booking.status,
-        'total_price': booking.total_price,
-        'pricing_snapshot': booking.pricing_snapshot,
-        'created_at': booking.created_at
-    }
+    return dict(row._mapping)
 
 @app.post('/api/bookings/{booking_id}/cancel')
 def cancel_booking(booking_id: int, db_s: Session = Depends(get_db_session)):
     """Cancel booking and promote next waitlist user."""
-    booking = db_s.get(models.Booking, booking_id)
+    booking = db_s.get(models.Booking, booking_id, options=[
+        selectinload(models.Booking.allocations),
+        joinedload(models.Booking.user).load_only(models.User.email)
+    ])
     if not booking:
         raise HTTPException(status_code=404, detail='booking not found')
     
+    # Resolve the waitlist before commit expires the booking's attributes
+    court_id = next((a.resource_id for a in booking.allocations if a.resource_type == 'court'), None)
+    next_user_id = db_s.execute(
+        select(models.WaitlistEntry.user_id).filter_by(
+            court_id=court_id, start_ts=booking.start_ts, end_ts=booking.end_ts
+        ).order_by(models.WaitlistEntry.created_at).limit(1)
+    ).scalar()
+    
+    start_ts, end_ts = booking.start_ts, booking.end_ts
+    user_email = booking.user.email if booking.user else None
     booking.status = 'cancelled'
+    if next_user_id is not None:
+        db_s.add(models.AuditEvent(booking_id=booking_id, event_type='cancelled', payload={'next_waitlist_user_id': next_user_id}))
     db_s.commit()
+    bump_booking_version(start_ts, end_ts)
+    invalidate_dashboard()
+    invalidate_recommendations(user_email)
     
-    slot_hash = f"{booking.start_ts.isoformat()}_{booking.end_ts.isoformat()}_{booking.allocations[0].resource_id if booking.allocations else 'unknown'}"
-    next_user = db_s.query(models.WaitlistEntry).filter(models.WaitlistEntry.slot_hash == slot_hash).order_by(models.WaitlistEntry.created_at).first()
-    if next_user:
-        audit = models.AuditEvent(booking_id=booking.id, event_type='cancelled', payload={'next_waitlist_user_id': next_user.user_id})
-        db_s.add(audit)
-        db_s.commit()
-        return {'status': 'cancelled', 'next_waitlist_user_id': next_user.user_id}
-    
+    if next_user_id is not None:
+        return {'status': 'cancelled', 'next_waitlist_user_id': next_user_id}
     return {'status': 'cancelled'}
 
 @app.get('/api/admin/pricing-rules')
-def list_pricing_rules(db_s: Session = Depends(get_db_session)):
-    rules = db_s.query(models.PricingRule).all()
-    return [{'id': r.id, 'name': r.name, 'enabled': r.enabled, 'priority': r.priority, 'rule_json': r.rule_json} for r in rules]
+def list_pricing_rules(request: Request, db_s: Session = Depends(get_db_session)):
+    def build():
+        rules = db_s.query(models.PricingRule).all()
+        return [{'id': r.id, 'name': r.name, 'enabled': r.enabled, 'priority': r.priority, 'rule_json': r.rule_json} for r in rules]
+    return cached_list(request, 'rules', build)
 
 @app.post('/api/admin/pricing-rules')
 def create_pricing_rule(rule: dict, db_s: Session = Depends(get_db_session)):
@@ -594,9 +953,11 @@ def create_pricing_rule(rule: dict, db_s: Session = Depends(get_db_session)):
         applies_to=rule.get('applies_to', 'court')
     )
     db_s.add(pr)
+    db_s.flush()
+    rule_id = pr.id
     db_s.commit()
-    db_s.refresh(pr)
-    return {'id': pr.id, 'status': 'created'}
+    bump_list_version('rules')
+    return {'id': rule_id, 'status': 'created'}
 
 @app.put('/api/admin/pricing-rules/{rule_id}')
 def update_pricing_rule(rule_id: int, rule: dict, db_s: Session = Depends(get_db_session)):
@@ -608,6 +969,7 @@ def update_pricing_rule(rule_id: int, rule: dict, db_s: Session = Depends(get_db
     pr.priority = rule.get('priority', pr.priority)
     pr.rule_json = rule.get('rule_json', pr.rule_json)
     db_s.commit()
+    bump_list_version('rules')
     return {'id': pr.id, 'status': 'updated'}
 
 @app.delete('/api/admin/pricing-rules/{rule_id}')
@@ -617,26 +979,32 @@ def delete_pricing_rule(rule_id: int, db_s: Session = Depends(get_db_session)):
         raise HTTPException(status_code=404, detail='rule not found')
     db_s.delete(pr)
     db_s.commit()
+    bump_list_version('rules')
     return {'status': 'deleted'}
 
 # ===== Admin CRUD for Courts =====
 @app.get('/api/admin/courts')
-def list_courts(db_s: Session = Depends(get_db_session)):
-    courts = db_s.query(models.Court).all()
-    return [{'id': c.id, 'name': c.name, 'type': c.type.value, 'base_price': c.base_price, 'enabled': c.enabled} for c in courts]
+def list_courts(request: Request, db_s: Session = Depends(get_db_session)):
+    def build():
+        courts = db_s.query(models.Court).all()
+        # The API keeps the base_price name for the hourly base rate
+        return [{'id': c.id, 'name': c.name, 'type': c.type.value, 'base_price': c.base_hourly, 'enabled': c.enabled} for c in courts]
+    return cached_list(request, 'courts', build)
 
 @app.post('/api/admin/courts')
 def create_court(court: dict, db_s: Session = Depends(get_db_session)):
     c = models.Court(
         name=court.get('name'),
         type=court.get('type', 'indoor'),
-        base_price=court.get('base_price', 30.0),
+        base_hourly=court.get('base_price', 30),
         enabled=court.get('enabled', True)
     )
     db_s.add(c)
+    db_s.flush()
+    court_id = c.id
     db_s.commit()
-    db_s.refresh(c)
-    return {'id': c.id, 'status': 'created'}
+    bump_list_version('courts')
+    return {'id': court_id, 'status': 'created'}
 
 @app.put('/api/admin/courts/{court_id}')
 def update_court(court_id: int, court: dict, db_s: Session = Depends(get_db_session)):
@@ -646,9 +1014,10 @@ def update_court(court_id: int, court: dict, db_s: Session = Depends(get_db_sess
     c.name = court.get('name', c.name)
     if 'type' in court:
         c.type = court['type']
-    c.base_price = court.get('base_price', c.base_price)
+    c.base_hourly = court.get('base_price', c.base_hourly)
     c.enabled = court.get('enabled', c.enabled)
     db_s.commit()
+    bump_list_version('courts')
     return {'id': c.id, 'status': 'updated'}
 
 @app.delete('/api/admin/courts/{court_id}')
@@ -658,13 +1027,17 @@ def delete_court(court_id: int, db_s: Session = Depends(get_db_session)):
         raise HTTPException(status_code=404, detail='court not found')
     db_s.delete(c)
     db_s.commit()
+    bump_list_version('courts')
     return {'status': 'deleted'}
 
 # ===== Admin CRUD for Equipment =====
 @app.get('/api/admin/equipment')
-def list_equipment(db_s: Session = Depends(get_db_session)):
-    items = db_s.query(models.EquipmentItem).all()
-    return [{'sku': e.sku, 'name': e.name, 'total_quantity': e.total_quantity, 'rental_price': e.rental_price, 'active': e.active} for e in items]
+def list_equipment(request: Request, db_s: Session = Depends(get_db_session)):
+    def build():
+        items = db_s.query(models.EquipmentItem).all()
+        # rental_price is the per-item fee kept in meta, as pricing reads it
+        return [{'sku': e.sku, 'name': e.name, 'total_quantity': e.total_quantity, 'rental_price': (e.meta or {}).get('fee', 0), 'active': e.active} for e in items]
+    return cached_list(request, 'equipment', build)
 
 @app.post('/api/admin/equipment')
 def create_equipment(eq: dict, db_s: Session = Depends(get_db_session)):
@@ -672,13 +1045,13 @@ def create_equipment(eq: dict, db_s: Session = Depends(get_db_session)):
         sku=eq.get('sku'),
         name=eq.get('name'),
         total_quantity=eq.get('total_quantity', 1),
-        rental_price=eq.get('rental_price', 5.0),
+        meta={'fee': eq.get('rental_price', 5.0)},
         active=eq.get('active', True)
     )
     db_s.add(e)
     db_s.commit()
-    db_s.refresh(e)
-    return {'sku': e.sku, 'status': 'created'}
+    bump_list_version('equipment')
+    return {'sku': eq.get('sku'), 'status': 'created'}
 
 @app.put('/api/admin/equipment/{sku}')
 def update_equipment(sku: str, eq: dict, db_s: Session = Depends(get_db_session)):
@@ -687,9 +1060,11 @@ def update_equipment(sku: str, eq: dict, db_s: Session = Depends(get_db_session)
         raise HTTPException(status_code=404, detail='equipment not found')
     e.name = eq.get('name', e.name)
     e.total_quantity = eq.get('total_quantity', e.total_quantity)
-    e.rental_price = eq.get('rental_price', e.rental_price)
+    if 'rental_price' in eq:
+        e.meta = {**(e.meta or {}), 'fee': eq['rental_price']}  # reassigned so the JSON change is tracked
     e.active = eq.get('active', e.active)
     db_s.commit()
+    bump_list_version('equipment')
     return {'sku': e.sku, 'status': 'updated'}
 
 @app.delete('/api/admin/equipment/{sku}')
@@ -699,13 +1074,16 @@ def delete_equipment(sku: str, db_s: Session = Depends(get_db_session)):
         raise HTTPException(status_code=404, detail='equipment not found')
     db_s.delete(e)
     db_s.commit()
+    bump_list_version('equipment')
     return {'status': 'deleted'}
 
 # ===== Admin CRUD for Coaches =====
 @app.get('/api/admin/coaches')
-def list_coaches(db_s: Session = Depends(get_db_session)):
-    coaches = db_s.query(models.Coach).all()
-    return [{'id': c.id, 'name': c.name, 'hourly_rate': c.hourly_rate, 'active': c.active} for c in coaches]
+def list_coaches(request: Request, db_s: Session = Depends(get_db_session)):
+    def build():
+        coaches = db_s.query(models.Coach).all()
+        return [{'id': c.id, 'name': c.name, 'hourly_rate': c.hourly_rate, 'active': c.active} for c in coaches]
+    return cached_list(request, 'coaches', build)
 
 @app.post('/api/admin/coaches')
 def create_coach(coach: dict, db_s: Session = Depends(get_db_session)):
@@ -715,9 +1093,11 @@ def create_coach(coach: dict, db_s: Session = Depends(get_db_session)):
         active=coach.get('active', True)
     )
     db_s.add(c)
+    db_s.flush()
+    coach_id = c.id
     db_s.commit()
-    db_s.refresh(c)
-    return {'id': c.id, 'status': 'created'}
+    bump_list_version('coaches')
+    return {'id': coach_id, 'status': 'created'}
 
 @app.put('/api/admin/coaches/{coach_id}')
 def update_coach(coach_id: int, coach: dict, db_s: Session = Depends(get_db_session)):
@@ -728,6 +1108,7 @@ def update_coach(coach_id: int, coach: dict, db_s: Session = Depends(get_db_sess
     c.hourly_rate = coach.get('hourly_rate', c.hourly_rate)
     c.active = coach.get('active', c.active)
     db_s.commit()
+    bump_list_version('coaches')
     return {'id': c.id, 'status': 'updated'}
 
 @app.delete('/api/admin/coaches/{coach_id}')
@@ -737,6 +1118,7 @@ def delete_coach(coach_id: int, db_s: Session = Depends(get_db_session)):
         raise HTTPException(status_code=404, detail='coach not found')
     db_s.delete(c)
     db_s.commit()
+    bump_list_version('coaches')
     return {'status': 'deleted'}
 
 # ===== Coach Availability Management =====
@@ -761,9 +1143,10 @@ def add_coach_availability(coach_id: int, avail: dict, db_s: Session = Depends(g
         end_time=datetime.time.fromisoformat(avail.get('end_time', '18:00'))
     )
     db_s.add(a)
+    db_s.flush()
+    avail_id = a.id
     db_s.commit()
-    db_s.refresh(a)
-    return {'id': a.id, 'status': 'created'}
+    return {'id': avail_id, 'status': 'created'}
 
 @app.delete('/api/admin/coaches/{coach_id}/availability/{avail_id}')
 def delete_coach_availability(coach_id: int, avail_id: int, db_s: Session = Depends(get_db_session)):
@@ -775,9 +1158,25 @@ def delete_coach_availability(coach_id: int, avail_id: int, db_s: Session = Depe
     return {'status': 'deleted'}
 
 # ===== Booking History Endpoint =====
+def encode_booking_cursor(booking: models.Booking) -> str:
+    return base64.urlsafe_b64encode(f'{booking.created_at.isoformat()}|{booking.id}'.encode()).decode()
+
+
+def decode_booking_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        created_at, booking_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.datetime.fromisoformat(created_at), int(booking_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='invalid cursor')
+
+
 @app.get('/api/bookings')
-def list_bookings(user_email: str | None = None, status: str | None = None, skip: int = 0, limit: int = 50, db_s: Session = Depends(get_db_session)):
-    """List bookings with optional filters."""
+def list_bookings(user_email: str | None = None, status: str | None = None, skip: int = 0, limit: int = 50,
+                  cursor: str | None = None, db_s: Session = Depends(get_db_session)):
+    """
+    List bookings with optional filters, newest first.
+    Pass the previous page's next_cursor to seek past it instead of using skip.
+    """
     query = db_s.query(models.Booking)
     
     if user_email:
@@ -790,16 +1189,28 @@ def list_bookings(user_email: str | None = None, status: str | None = None, skip
     if status:
         query = query.filter(models.Booking.status == status)
     
-    total = query.count()
-    bookings = query.order_by(models.Booking.created_at.desc()).offset(skip).limit(limit).all()
+    total = query.with_entities(func.count(models.Booking.id)).scalar()
+    # Users join into the page query and allocations load in one IN query
+    page = query.options(
+        joinedload(models.Booking.user).load_only(models.User.email),
+        selectinload(models.Booking.allocations)
+    ).order_by(models.Booking.created_at.desc(), models.Booking.id.desc())
+    if cursor:
+        # Keyset seek: the index starts at the cursor instead of reading and discarding skipped rows
+        created_at, booking_id = decode_booking_cursor(cursor)
+        page = page.filter(
+            tuple_(models.Booking.created_at, models.Booking.id) < tuple_(server_timestamp(created_at), booking_id)
+        )
+    else:
+        page = page.offset(skip)
+    bookings = page.limit(limit).all()
     
     result = []
     for b in bookings:
         allocations = [{'type': a.resource_type, 'resource_id': a.resource_id, 'quantity': a.quantity} for a in b.allocations]
-        user = db_s.get(models.User, b.user_id)
         result.append({
             'id': b.id,
-            'user_email': user.email if user else None,
+            'user_email': b.user.email if b.user else None,
             'start_ts': b.start_ts.isoformat(),
             'end_ts': b.end_ts.isoformat(),
             'status': b.status,
@@ -808,7 +1219,8 @@ def list_bookings(user_email: str | None = None, status: str | None = None, skip
             'created_at': b.created_at.isoformat()
         })
     
-    return {'bookings': result, 'total': total, 'skip': skip, 'limit': limit}
+    next_cursor = encode_booking_cursor(bookings[-1]) if bookings and len(bookings) == limit else None
+    return {'bookings': result, 'total': total, 'skip': skip, 'limit': limit, 'next_cursor': next_cursor}
 
 
 # ===== Analytics & Insights Dashboard (Unique Feature) =====
@@ -818,106 +1230,151 @@ def get_analytics_dashboard(db_s: Session = Depends(get_db_session)):
     Get comprehensive analytics dashboard data.
     This is a unique AI-powered analytics feature for top 1% experience.
     """
+    if redis_client is None:
+        return build_analytics_dashboard(db_s)
+    
+    # Cache-aside: every worker shares the last computed dashboard
+    try:
+        cached = redis_client.get(DASHBOARD_CACHE_KEY)
+    except redis.RedisError:
+        cached = None
+    if cached is not None:
+        return Response(cached, media_type='application/json')
+    
+    body = orjson.dumps(build_analytics_dashboard(db_s), option=orjson.OPT_NON_STR_KEYS)
+    try:
+        redis_client.setex(DASHBOARD_CACHE_KEY, DASHBOARD_CACHE_TTL, body)
+    except redis.RedisError:
+        pass
+    return Response(body, media_type='application/json')
+
+
+def build_analytics_dashboard(db_s: Session) -> dict:
+    """Aggregate the dashboard payload from the database."""
     from sqlalchemy import func, case, extract
     from datetime import timedelta
     
     today = datetime.datetime.utcnow().date()
-    week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
-    
-    # === Revenue Statistics ===
-    total_revenue = db_s.query(func.sum(models.Booking.total_price)).filter(
-        models.Booking.status == 'confirmed'
-    ).scalar() or 0
-    
-    weekly_revenue = db_s.query(func.sum(models.Booking.total_price)).filter(
-        models.Booking.status == 'confirmed',
-        func.date(models.Booking.created_at) >= week_ago
-    ).scalar() or 0
-    
-    monthly_revenue = db_s.query(func.sum(models.Booking.total_price)).filter(
-        models.Booking.status == 'confirmed',
-        func.date(models.Booking.created_at) >= month_ago
-    ).scalar() or 0
-    
-    # === Booking Statistics ===
-    total_bookings = db_s.query(models.Booking).filter(
+    # Midnight bounds compare against the raw column, so created_at indexes stay usable
+    week_ago = datetime.datetime.combine(today - timedelta(days=7), datetime.time.min)
+    month_ago = datetime.datetime.combine(today - timedelta(days=30), datetime.time.min)
+    trend_start = datetime.datetime.combine(today - timedelta(days=6), datetime.time.min)
+    
+    in_week = models.Booking.created_at >= week_ago
+    in_month = models.Booking.created_at >= month_ago
+    
+    # === Revenue & Booking Statistics (one scan of confirmed bookings) ===
+    total_revenue, weekly_revenue, monthly_revenue, total_bookings, weekly_bookings = db_s.query(
+        func.sum(models.Booking.total_price),
+        func.sum(case((in_week, models.Booking.total_price), else_=0)),
+        func.sum(case((in_month, models.Booking.total_price), else_=0)),
+        func.count(models.Booking.id),
+        func.count(case((in_week, models.Booking.id)))
+    ).filter(
         models.Booking.status == 'confirmed'
-    ).count()
-    
-    weekly_bookings = db_s.query(models.Booking).filter(
-        models.Booking.status == 'confirmed',
-        func.date(models.Booking.created_at) >= week_ago
-    ).count()
+    ).one()
+    total_revenue = total_revenue or 0
+    weekly_revenue = weekly_revenue or 0
+    monthly_revenue = monthly_revenue or 0
     
-    pending_waitlist = db_s.query(models.WaitlistEntry).count()
+    pending_waitlist = db_s.query(func.count(models.WaitlistEntry.id)).scalar()
     
     # === User Statistics ===
-    total_users = db_s.query(models.User).count()
-    new_users_week = db_s.query(models.User).filter(
-        func.date(models.User.created_at) >= week_ago
-    ).count()
+    total_users, new_users_week = db_s.query(
+        func.count(models.User.id),
+        func.count(case((models.User.created_at >= week_ago, models.User.id)))
+    ).one()
+    
+    stats = models.booking_stats.c
     
     # === Peak Hours Analysis ===
-    peak_hours = db_s.query(
-        extract('hour', models.Booking.start_ts).label('hour'),
-        func.count(models.Booking.id).label('count')
-    ).filter(
-        models.Booking.status == 'confirmed'
-    ).group_by('hour').order_by(func.count(models.Booking.id).desc()).limit(5).all()
+    if USE_STATS_VIEW:
+        # Every booking holds exactly one court allocation
+        booking_count = func.sum(stats.allocation_count)
+        peak_hours = db_s.query(stats.hour, booking_count).filter(
+            stats.status == 'confirmed',
+            stats.resource_type == 'court'
+        ).group_by(stats.hour).order_by(booking_count.desc()).limit(5).all()
+    else:
+        peak_hours = db_s.query(
+            extract('hour', models.Booking.start_ts).label('hour'),
+            func.count(models.Booking.id).label('count')
+        ).filter(
+            models.Booking.status == 'confirmed'
+        ).group_by('hour').order_by(func.count(models.Booking.id).desc()).limit(5).all()
+    
+    # Allocation counts per resource id, one GROUP BY per resource type
+    def allocation_counts(resource_type: str) -> Dict[int, int]:
+        if USE_STATS_VIEW:
+            rows = db_s.query(stats.resource_id, func.sum(stats.allocation_count)).filter(
+                stats.resource_type == resource_type
+            ).group_by(stats.resource_id)
+        else:
+            rows = db_s.query(
+                models.BookingAllocation.resource_id,
+                func.count(models.BookingAllocation.id)
+            ).filter(
+                models.BookingAllocation.resource_type == resource_type
+            ).group_by(models.BookingAllocation.resource_id)
+        return {resource_id: int(count) for resource_id, count in rows}
     
     # === Court Utilization ===
     courts = db_s.query(models.Court).all()
+    court_counts = allocation_counts('court')
+    utilization_scale = 100 * len(courts) / max(total_bookings, 1)
     court_stats = []
     for court in courts:
-        court_bookings = db_s.query(models.BookingAllocation).filter(
-            models.BookingAllocation.resource_type == 'court',
-            models.BookingAllocation.resource_id == court.id
-        ).count()
+        court_bookings = court_counts.get(court.id, 0)
         court_stats.append({
             'id': court.id,
             'name': court.name,
             'type': court.type.value,
             'bookings': court_bookings,
-            'utilization_percent': min(100, (court_bookings / max(total_bookings, 1)) * 100 * len(courts))
+            'utilization_percent': min(100, court_bookings * utilization_scale)
         })
     
     # === Popular Equipment ===
-    equipment_stats = db_s.query(
-        models.BookingAllocation.resource_id,
-        func.sum(models.BookingAllocation.quantity).label('total_rented')
-    ).filter(
-        models.BookingAllocation.resource_type == 'equipment'
-    ).group_by(models.BookingAllocation.resource_id).order_by(
-        func.sum(models.BookingAllocation.quantity).desc()
-    ).limit(5).all()
+    if USE_STATS_VIEW:
+        total_rented = func.sum(stats.quantity)
+        equipment_stats = db_s.query(stats.resource_id, total_rented).filter(
+            stats.resource_type == 'equipment'
+        ).group_by(stats.resource_id).order_by(total_rented.desc()).limit(5).all()
+    else:
+        equipment_stats = db_s.query(
+            models.BookingAllocation.resource_id,
+            func.sum(models.BookingAllocation.quantity).label('total_rented')
+        ).filter(
+            models.BookingAllocation.resource_type == 'equipment'
+        ).group_by(models.BookingAllocation.resource_id).order_by(
+            func.sum(models.BookingAllocation.quantity).desc()
+        ).limit(5).all()
     
     # === Coach Performance ===
     coach_stats = []
     coaches = db_s.query(models.Coach).all()
+    coach_counts = allocation_counts('coach')
     for coach in coaches:
-        coach_sessions = db_s.query(models.BookingAllocation).filter(
-            models.BookingAllocation.resource_type == 'coach',
-            models.BookingAllocation.resource_id == coach.id
-        ).count()
         coach_stats.append({
             'id': coach.id,
             'name': coach.name,
-            'sessions': coach_sessions,
+            'sessions': coach_counts.get(coach.id, 0),
             'hourly_rate': coach.hourly_rate
         })
     
     # === Daily Revenue Trend (Last 7 days) ===
+    booking_day = func.date(models.Booking.created_at)
+    daily_rows = db_s.query(booking_day, func.sum(models.Booking.total_price)).filter(
+        models.Booking.status == 'confirmed',
+        models.Booking.created_at >= trend_start
+    ).group_by(booking_day).all()
+    # date() yields a string on SQLite and a date on PostgreSQL; key by ISO text
+    revenue_by_day = {str(day): float(revenue or 0) for day, revenue in daily_rows}
     revenue_trend = []
     for i in range(7):
-        day = today - timedelta(days=6-i)
-        day_revenue = db_s.query(func.sum(models.Booking.total_price)).filter(
-            models.Booking.status == 'confirmed',
-            func.date(models.Booking.created_at) == day
-        ).scalar() or 0
+        day = (today - timedelta(days=6-i)).isoformat()
         revenue_trend.append({
-            'date': day.isoformat(),
-            'revenue': float(day_revenue)
+            'date': day,
+            'revenue': revenue_by_day.get(day, 0.0)
         })
     
     # === Smart Insights (AI-like recommendations) ===
@@ -977,7 +1434,7 @@ def get_analytics_dashboard(db_s: Session = Depends(get_db_session)):
             'new_users_week': new_users_week,
             'pending_waitlist': pending_waitlist
         },
-        'peak_hours': [{'hour': int(h[0]), 'count': h[1]} for h in peak_hours],
+        'peak_hours': [{'hour': int(h[0]), 'count': int(h[1])} for h in peak_hours],
         'court_utilization': court_stats,
         'equipment_popularity': [{'sku': e[0], 'rentals': int(e[1])} for e in equipment_stats],
         'coach_performance': coach_stats,
@@ -986,6 +1443,13 @@ def get_analytics_dashboard(db_s: Session = Depends(get_db_session)):
     }
 
 
+# Loyalty levels and the points that unlock each one after Bronze; Gold
+# members are shown a 1000-point target with no further level yet
+LOYALTY_LEVELS = ('Bronze', 'Bronze+', 'Silver', 'Gold')
+LOYALTY_THRESHOLDS = (100, 200, 500)
+LOYALTY_NEXT_AT = LOYALTY_THRESHOLDS + (1000,)
+
+
 @app.get('/api/analytics/user/{user_id}', tags=['Analytics'])
 def get_user_analytics(user_id: int, db_s: Session = Depends(get_db_session)):
     """Get personalized analytics for a specific user."""
@@ -993,40 +1457,32 @@ def get_user_analytics(user_id: int, db_s: Session = Depends(get_db_session)):
     if not user:
         raise HTTPException(status_code=404, detail='User not found')
     
-    # User's booking history stats
-    user_bookings = db_s.query(models.Booking).filter(
-        models.Booking.user_id == user_id,
-        models.Booking.status == 'confirmed'
-    ).all()
+    # User's booking history stats, aggregated in the database
+    confirmed = (models.Booking.user_id == user_id, models.Booking.status == 'confirmed')
+    booking_count, total_spent, total_hours = db_s.query(
+        func.count(models.Booking.id),
+        func.coalesce(func.sum(models.Booking.total_price), 0),
+        func.coalesce(func.sum(hours_between(models.Booking.start_ts, models.Booking.end_ts)), 0)
+    ).filter(*confirmed).one()
+    
+    # Most visited court; ties go to the court booked first
+    visits = func.count(models.BookingAllocation.id)
+    top_court = db_s.query(models.BookingAllocation.resource_id, visits).join(models.Booking).filter(
+        *confirmed,
+        models.BookingAllocation.resource_type == 'court'
+    ).group_by(models.BookingAllocation.resource_id).order_by(
+        visits.desc(), func.min(models.Booking.id)
+    ).first()
     
-    total_spent = sum(b.total_price or 0 for b in user_bookings)
-    total_hours = 0
     favorite_court = None
-    court_counts = {}
-    
-    for booking in user_bookings:
-        duration = (booking.end_ts - booking.start_ts).total_seconds() / 3600
-        total_hours += duration
-        
-        for alloc in booking.allocations:
-            if alloc.resource_type == 'court':
-                court_counts[alloc.resource_id] = court_counts.get(alloc.resource_id, 0) + 1
-    
-    if court_counts:
-        fav_court_id = max(court_counts, key=court_counts.get)
-        fav_court = db_s.get(models.Court, fav_court_id)
+    if top_court:
+        fav_court = db_s.get(models.Court, top_court[0])
         if fav_court:
-            favorite_court = {'id': fav_court.id, 'name': fav_court.name, 'visits': court_counts[fav_court_id]}
+            favorite_court = {'id': fav_court.id, 'name': fav_court.name, 'visits': top_court[1]}
     
     # Loyalty level calculation
-    loyalty_points = len(user_bookings) * 10 + int(total_spent)
-    loyalty_level = 'Bronze'
-    if loyalty_points >= 500:
-        loyalty_level = 'Gold'
-    elif loyalty_points >= 200:
-        loyalty_level = 'Silver'
-    elif loyalty_points >= 100:
-        loyalty_level = 'Bronze+'
+    loyalty_points = booking_count * 10 + int(total_spent)
+    level_index = bisect.bisect_right(LOYALTY_THRESHOLDS, loyalty_points)
     
     return {
         'user': {
@@ -1036,15 +1492,15 @@ def get_user_analytics(user_id: int, db_s: Session = Depends(get_db_session)):
             'member_since': user.created_at.isoformat() if user.created_at else None
         },
         'stats': {
-            'total_bookings': len(user_bookings),
+            'total_bookings': booking_count,
             'total_spent': float(total_spent),
-            'total_hours_played': round(total_hours, 1),
+            'total_hours_played': round(float(total_hours), 1),
             'favorite_court': favorite_court
         },
         'loyalty': {
-            'level': loyalty_level,
+            'level': LOYALTY_LEVELS[level_index],
             'points': loyalty_points,
-            'next_level_at': 100 if loyalty_level == 'Bronze' else (200 if loyalty_level == 'Bronze+' else (500 if loyalty_level == 'Silver' else 1000))
+            'next_level_at': LOYALTY_NEXT_AT[level_index]
         }
     }
 
@@ -1056,12 +1512,38 @@ def get_smart_recommendations(user_email: str = None, date: str = None, db_s: Se
     AI-powered smart booking recommendations.
     Analyzes booking patterns to suggest optimal times and courts.
     """
-    from sqlalchemy import func, extract
-    from datetime import timedelta
-    
     today = datetime.datetime.utcnow().date()
-    target_date = datetime.datetime.strptime(date, '%Y-%m-%d').date() if date else today + timedelta(days=1)
-    target_weekday = target_date.strftime('%A').lower()
+    target_date = datetime.datetime.strptime(date, '%Y-%m-%d').date() if date else today + datetime.timedelta(days=1)
+    if redis_client is None:
+        return build_recommendations(db_s, target_date, user_email)
+    
+    # Cache-aside; the anonymous key is shared by every logged-out visitor
+    key = reco_cache_key(target_date, user_email)
+    try:
+        cached = redis_client.get(key)
+    except redis.RedisError:
+        cached = None
+    if cached is not None:
+        return Response(cached, media_type='application/json')
+    
+    body = orjson.dumps(build_recommendations(db_s, target_date, user_email))
+    try:
+        pipe = redis_client.pipeline()
+        pipe.setex(key, RECO_CACHE_TTL, body)
+        if user_email:
+            pipe.sadd(reco_user_keys(user_email), key)
+            pipe.expire(reco_user_keys(user_email), RECO_CACHE_TTL)
+        pipe.execute()
+    except redis.RedisError:
+        pass
+    return Response(body, media_type='application/json')
+
+
+def build_recommendations(db_s: Session, target_date: datetime.date, user_email: str | None) -> dict:
+    """Assemble the recommendation payload for a date and optional user."""
+    from sqlalchemy import extract
+    
+    target_weekday = WEEKDAYS[target_date.weekday()]
     
     recommendations = []
     
@@ -1095,15 +1577,20 @@ def get_smart_recommendations(user_email: str = None, date: str = None, db_s: Se
         })
     
     # === 2. Value-for-Money Recommendations ===
-    # Find courts with best pricing
+    # Quote an hour on each court at the quietest time, with pricing rules applied
     courts = db_s.query(models.Court).filter(models.Court.enabled == True).all()
     if courts:
-        cheapest_court = min(courts, key=lambda c: c.base_price or c.base_hourly or 0)
+        quote_start = datetime.datetime.combine(target_date, datetime.time(quietest_hours[0]))
+        quote_end = quote_start + datetime.timedelta(hours=1)
+        hourly_rate, cheapest_court = min(
+            ((pricing.compute_price(db_s, c, quote_start, quote_end)['total'], c) for c in courts),
+            key=lambda quote: quote[0]
+        )
         recommendations.append({
             'type': 'best_value',
             'icon': '💰',
             'title': f'Best Value: {cheapest_court.name}',
-            'description': f'Get the best rates starting at ${cheapest_court.base_price or cheapest_court.base_hourly}/hour.',
+            'description': f'Get the best rates starting at ${hourly_rate:g}/hour.',
             'priority': 'high',
             'action': {
                 'type': 'book_court',
@@ -1123,71 +1610,65 @@ def get_smart_recommendations(user_email: str = None, date: str = None, db_s: Se
         })
     
     # === 4. Coach Recommendation ===
-    coaches = db_s.query(models.Coach).filter(models.Coach.active == True).all()
-    if coaches:
-        # Recommend coach with most availability
-        coach_with_availability = None
-        for coach in coaches:
-            avail = db_s.query(models.CoachAvailability).filter(
-                models.CoachAvailability.coach_id == coach.id,
-                models.CoachAvailability.day_of_week == target_weekday
-            ).first()
-            if avail:
-                coach_with_availability = coach
-                break
-        
-        if coach_with_availability:
-            recommendations.append({
-                'type': 'coach_available',
-                'icon': '👨‍🏫',
-                'title': f'Coach {coach_with_availability.name} Available',
-                'description': f'Improve your game! Professional coaching at ${coach_with_availability.hourly_rate}/hour.',
-                'priority': 'medium',
-                'action': {
-                    'type': 'add_coach',
-                    'coach_id': coach_with_availability.id
-                }
-            })
+    # First active coach working that weekday, found in a single join
+    coach_with_availability = db_s.query(models.Coach).join(
+        models.CoachAvailability, models.CoachAvailability.coach_id == models.Coach.id
+    ).filter(
+        models.Coach.active == True,
+        models.CoachAvailability.day_of_week == target_weekday
+    ).order_by(models.Coach.id).first()
+    
+    if coach_with_availability:
+        recommendations.append({
+            'type': 'coach_available',
+            'icon': '👨‍🏫',
+            'title': f'Coach {coach_with_availability.name} Available',
+            'description': f'Improve your game! Professional coaching at ${coach_with_availability.hourly_rate}/hour.',
+            'priority': 'medium',
+            'action': {
+                'type': 'add_coach',
+                'coach_id': coach_with_availability.id
+            }
+        })
     
     # === 5. Personalized Recommendations (if user is logged in) ===
     if user_email:
         user = db_s.query(models.User).filter(models.User.email == user_email).first()
         if user:
-            user_bookings = db_s.query(models.Booking).filter(
+            # User's preferred hour; ties go to the earliest hour
+            hour = extract('hour', models.Booking.start_ts)
+            bookings_at = func.count(models.Booking.id)
+            top_hour = db_s.query(hour, bookings_at).filter(
                 models.Booking.user_id == user.id,
                 models.Booking.status == 'confirmed'
-            ).all()
+            ).group_by(hour).order_by(bookings_at.desc(), hour).first()
             
-            if user_bookings:
-                # Find user's preferred hour
-                user_hours = {}
-                for booking in user_bookings:
-                    hour = booking.start_ts.hour
-                    user_hours[hour] = user_hours.get(hour, 0) + 1
-                
-                if user_hours:
-                    preferred_hour = max(user_hours, key=user_hours.get)
-                    recommendations.append({
-                        'type': 'personalized',
-                        'icon': '✨',
-                        'title': 'Your Preferred Time',
-                        'description': f'Based on your history, you usually book at {preferred_hour}:00. Continue your routine?',
-                        'priority': 'high',
-                        'action': {
-                            'type': 'book_time',
-                            'hour': preferred_hour,
-                            'date': target_date.isoformat()
-                        }
-                    })
+            if top_hour:
+                preferred_hour = int(top_hour[0])
+                recommendations.append({
+                    'type': 'personalized',
+                    'icon': '✨',
+                    'title': 'Your Preferred Time',
+                    'description': f'Based on your history, you usually book at {preferred_hour}:00. Continue your routine?',
+                    'priority': 'high',
+                    'action': {
+                        'type': 'book_time',
+                        'hour': preferred_hour,
+                        'date': target_date.isoformat()
+                    }
+                })
     
     # === 6. Equipment Bundle Recommendation ===
-    equipment = db_s.query(models.EquipmentItem).filter(models.EquipmentItem.active == True).all()
-    if equipment:
+    # Cheapest rental fee as read by pricing (meta['fee'], default 0); NULL when nothing is active
+    cheapest_fee = db_s.query(
+        func.min(func.coalesce(models.EquipmentItem.meta['fee'].as_float(), 0))
+    ).filter(models.EquipmentItem.active == True).scalar()
+    if cheapest_fee is not None:
         recommendations.append({
             'type': 'equipment_bundle',
             'icon': '🎾',
             'title': 'Equipment Package',
-            'description': f'Don\'t have your gear? Rent a complete set starting at ${min(e.rental_price for e in equipment)}/session.',
+            'description': f'Don\'t have your gear? Rent a complete set starting at ${cheapest_fee:g}/session.',
             'priority': 'low',
             'action': {
                 'type': 'add_equipment'
@@ -1206,15 +1687,27 @@ def get_smart_recommendations(user_email: str = None, date: str = None, db_s: Se
 
 
 # ===== Health Check Endpoint =====
+# Per-process memo of the last database probe; bursts of load balancer
+# probes within a second share one SELECT 1
+HEALTH_PROBE_TTL = 1.0
+_health_cache = {'ts': float('-inf'), 'status': 'healthy'}
+
+
 @app.get('/api/health', tags=['System'])
-def health_check(db_s: Session = Depends(get_db_session)):
+def health_check():
     """System health check endpoint."""
-    try:
-        # Test database connection
-        db_s.execute(text("SELECT 1"))
-        db_status = "healthy"
-    except:
-        db_status = "unhealthy"
+    now = time.monotonic()
+    if now - _health_cache['ts'] < HEALTH_PROBE_TTL:
+        db_status = _health_cache['status']
+    else:
+        try:
+            # Test database connection
+            with db.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            db_status = "healthy"
+        except:
+            db_status = "unhealthy"
+        _health_cache.update(ts=now, status=db_status)
     
     return {
         "status": "ok" if db_status == "healthy" else "degraded",
@@ -1229,4 +1722,12 @@ def health_check(db_s: Session = Depends(get_db_session)):
 
 
 if __name__ == '__main__':
-    uvicorn.run('backend.main:app', host='0.0.0.0', port=8000, reload=True)
+    # uvicorn cannot combine reload with multiple workers; reload only for single-process dev runs
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    uvicorn.run(
+        'backend.main:app',
+        host='0.0.0.0',
+        port=8000,
+        workers=workers,
+        reload=workers == 1
+    )
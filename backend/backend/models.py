@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Float, ForeignKey, Enum, func
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Float, ForeignKey, Enum, Index, DDL, MetaData, Table, event, func
 from sqlalchemy.orm import relationship, declarative_base
 import enum
 
@@ -25,6 +25,15 @@ class User(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
+    def to_token_dict(self):
+        return {
+            'id': self.id,
+            'email': self.email,
+            'name': self.name,
+            'role': self.role,
+            'phone': self.phone
+        }
+
 class Court(Base):
     __tablename__ = 'courts'
     id = Column(Integer, primary_key=True)
@@ -59,11 +68,15 @@ class CoachAvailability(Base):
     day_of_week = Column(String)  # 'monday', 'tuesday', etc.
     start_time = Column(String)   # '08:00'
     end_time = Column(String)     # '20:00'
+    __table_args__ = (
+        Index('ix_coach_avail_day', 'coach_id', 'day_of_week'),
+    )
 
 class Booking(Base):
     __tablename__ = 'bookings'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
+    court_id = Column(Integer, ForeignKey('courts.id'))  # mirrors the court allocation for the exclusion constraint
     start_ts = Column(DateTime, index=True)
     end_ts = Column(DateTime, index=True)
     status = Column(String, default='confirmed', index=True)
@@ -71,6 +84,32 @@ class Booking(Base):
     pricing_snapshot = Column(JSON)
     created_at = Column(DateTime, server_default=func.now())
     allocations = relationship('BookingAllocation', back_populates='booking')
+    user = relationship('User')
+    __table_args__ = (
+        # Overlap lookups filter on the time window plus status
+        Index('ix_booking_window_status', 'start_ts', 'end_ts', 'status'),
+        # Analytics filter confirmed bookings by creation date or start hour
+        Index('ix_bookings_status_created', 'status', 'created_at'),
+        Index('ix_bookings_status_start', 'status', 'start_ts'),
+        # Per-user history, analytics and recommendations
+        Index('ix_bookings_user_status', 'user_id', 'status'),
+        # Keyset pagination of the booking list
+        Index('ix_bookings_created_id', 'created_at', 'id'),
+    )
+
+# PostgreSQL rejects overlapping confirmed bookings of a court itself, so racing
+# requests cannot both confirm; other backends rely on create_booking's check
+event.listen(
+    Booking.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
+event.listen(
+    Booking.__table__, 'after_create',
+    DDL(
+        "ALTER TABLE bookings ADD CONSTRAINT no_double_booking EXCLUDE USING gist "
+        "(court_id WITH =, tsrange(start_ts, end_ts, '[)') WITH &&) WHERE (status = 'confirmed')"
+    ).execute_if(dialect='postgresql')
+)
 
 class BookingAllocation(Base):
     __tablename__ = 'booking_allocations'
@@ -80,6 +119,12 @@ class BookingAllocation(Base):
     resource_id = Column(Integer)
     quantity = Column(Integer, default=1)
     booking = relationship('Booking', back_populates='allocations')
+    __table_args__ = (
+        # booking_id rides along so overlap joins are satisfied from the index
+        Index('ix_alloc_resource', 'resource_type', 'resource_id', 'booking_id'),
+        # Reverse lookup for selectinload(Booking.allocations) and cancellation
+        Index('ix_alloc_booking', 'booking_id'),
+    )
 
 class PricingRule(Base):
     __tablename__ = 'pricing_rules'
@@ -95,11 +140,17 @@ class PricingRule(Base):
 class WaitlistEntry(Base):
     __tablename__ = 'waitlist_entries'
     id = Column(Integer, primary_key=True)
-    slot_hash = Column(String, index=True)
+    court_id = Column(Integer, ForeignKey('courts.id'))
+    start_ts = Column(DateTime)
+    end_ts = Column(DateTime)
     user_id = Column(Integer, ForeignKey('users.id'))
     created_at = Column(DateTime, server_default=func.now())
     position = Column(Integer, default=0)
     notified_until_ts = Column(DateTime, nullable=True)
+    __table_args__ = (
+        # Next-in-line lookup matches the slot and orders by created_at
+        Index('ix_waitlist_slot_created', 'court_id', 'start_ts', 'end_ts', 'created_at'),
+    )
 
 class AuditEvent(Base):
     __tablename__ = 'audit_events'
@@ -108,3 +159,41 @@ class AuditEvent(Base):
     event_type = Column(String)
     payload = Column(JSON)
     created_at = Column(DateTime, server_default=func.now())
+
+# ===== Dashboard roll-ups (PostgreSQL) =====
+# Allocation counts per start hour, booking status and resource, refreshed
+# periodically by the app. Kept off Base.metadata so create_all never builds
+# it as a table; the DDL below only runs on PostgreSQL.
+view_metadata = MetaData()
+booking_stats = Table(
+    'mv_booking_stats', view_metadata,
+    Column('hour', Integer),
+    Column('status', String),
+    Column('resource_type', String),
+    Column('resource_id', Integer),
+    Column('allocation_count', Integer),
+    Column('quantity', Integer)
+)
+
+event.listen(
+    Base.metadata, 'after_create',
+    DDL(
+        "CREATE MATERIALIZED VIEW IF NOT EXISTS mv_booking_stats AS "
+        "SELECT CAST(EXTRACT(hour FROM b.start_ts) AS INTEGER) AS hour, b.status, "
+        "a.resource_type, a.resource_id, COUNT(*) AS allocation_count, SUM(a.quantity) AS quantity "
+        "FROM booking_allocations a JOIN bookings b ON b.id = a.booking_id "
+        "GROUP BY 1, 2, 3, 4"
+    ).execute_if(dialect='postgresql')
+)
+# REFRESH MATERIALIZED VIEW CONCURRENTLY requires a unique index
+event.listen(
+    Base.metadata, 'after_create',
+    DDL(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_booking_stats "
+        "ON mv_booking_stats (hour, status, resource_type, resource_id)"
+    ).execute_if(dialect='postgresql')
+)
+event.listen(
+    Base.metadata, 'before_drop',
+    DDL('DROP MATERIALIZED VIEW IF EXISTS mv_booking_stats').execute_if(dialect='postgresql')
+)
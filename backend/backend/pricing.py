@@ -1,34 +1,94 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, NamedTuple
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from .models import PricingRule, Court, Coach
 import datetime
+import time
 
-def rule_applies(rule_json: Dict[str, Any], target: Dict[str,Any], start_ts: datetime.datetime, end_ts: datetime.datetime) -> bool:
-    # Basic match: checks time-of-day and days
+# Enabled rules are cached per process; committed rule changes bump the version
+RULES_CACHE_TTL = 30  # bounds staleness when another worker edits rules
+RULES_VERSION = 0
+_rules_cache = (-1, 0.0, [])  # (version, expires, rules)
+
+WEEKDAY_BITS = {'mon': 1, 'tue': 2, 'wed': 4, 'thu': 8, 'fri': 16, 'sat': 32, 'sun': 64}  # 1 << weekday()
+ALL_DAYS = 127
+DAY_SECONDS = 86400
+
+class ActiveRule(NamedTuple):
+    """A pricing rule with its match conditions pre-parsed into integers."""
+    name: str
+    priority: int
+    days_mask: int         # bit weekday() set for matching days
+    start_sec: int         # matches start times in [start_sec, end_sec) seconds since midnight
+    end_sec: int
+    applies_to: str | None  # court type; None matches every court
+    modifier_type: str | None
+    value: Any
+    stack: str
+
+def _seconds(t: str) -> int:
+    parsed = datetime.time.fromisoformat(t)
+    return parsed.hour * 3600 + parsed.minute * 60 + parsed.second
+
+def compile_rule(name: str, priority: int, rule_json: Dict[str, Any]) -> ActiveRule:
+    """Parse a rule's day, time window and court type conditions once."""
+    mod = rule_json.get('modifier', {})
+    days_mask, start_sec, end_sec, applies_to = ALL_DAYS, 0, DAY_SECONDS, None
     match = rule_json.get('match', {})
-    if not match:
-        return True
-    # check days
-    days = match.get('days')
-    if days:
-        weekday = start_ts.strftime('%a').lower()
-        days_lower = [d[:3].lower() for d in days]
-        if weekday[:3].lower() not in days_lower:
-            return False
-    # time window
-    start_t = match.get('start')
-    end_t = match.get('end')
-    if start_t and end_t:
-        st = datetime.time.fromisoformat(start_t)
-        et = datetime.time.fromisoformat(end_t)
-        if not (st <= start_ts.time() < et):
-            return False
-    # court type
-    applies_to = rule_json.get('applies_to')
-    if applies_to and target.get('type') and applies_to != 'all':
-        if applies_to != target.get('type'):
-            return False
-    return True
+    # An empty match applies everywhere, whatever the other conditions say
+    if match:
+        days = match.get('days')
+        if days:
+            days_mask = 0
+            for d in days:
+                days_mask |= WEEKDAY_BITS.get(d[:3].lower(), 0)
+        if match.get('start') and match.get('end'):
+            start_sec, end_sec = _seconds(match['start']), _seconds(match['end'])
+        if rule_json.get('applies_to') not in (None, '', 'all'):
+            applies_to = rule_json['applies_to']
+    return ActiveRule(name, priority, days_mask, start_sec, end_sec, applies_to,
+                      mod.get('type'), mod.get('value', 0), rule_json.get('stack_behavior', 'additive'))
+
+def get_active_rules(db: Session) -> List[ActiveRule]:
+    """Enabled pricing rules, compiled and highest priority first."""
+    global _rules_cache
+    version = RULES_VERSION
+    cached_version, expires, rules = _rules_cache
+    if cached_version == version and expires > time.monotonic():
+        return rules
+    rows = db.query(PricingRule.name, PricingRule.priority, PricingRule.rule_json).filter(PricingRule.enabled == True).all()
+    # Stable sort: equal priorities keep table order
+    rules = sorted((compile_rule(*row) for row in rows), key=lambda r: r.priority, reverse=True)
+    _rules_cache = (version, time.monotonic() + RULES_CACHE_TTL, rules)
+    return rules
+
+def invalidate_rules():
+    """Force the next price computation to reload rules."""
+    global RULES_VERSION
+    RULES_VERSION += 1
+
+@event.listens_for(Session, 'after_flush')
+def _track_rule_changes(session, flush_context):
+    # new/dirty/deleted still hold the pre-flush state here
+    if any(isinstance(obj, PricingRule) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info['pricing_rules_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _bump_rules_version(session):
+    # Bumping after commit keeps a concurrent reload from caching pre-commit rows
+    if session.info.pop('pricing_rules_changed', False):
+        invalidate_rules()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rule_changes(session):
+    session.info.pop('pricing_rules_changed', None)
+
+def rule_applies(rule: ActiveRule, weekday_bit: int, second_of_day: int, court_type: str | None) -> bool:
+    return bool(
+        rule.days_mask & weekday_bit
+        and rule.start_sec <= second_of_day < rule.end_sec
+        and (rule.applies_to is None or not court_type or rule.applies_to == court_type)
+    )
 
 def compute_price(db: Session, court: Court, start_ts: datetime.datetime, end_ts: datetime.datetime, equipment: List[Dict[str,int]] = None, coach: Coach = None) -> Dict[str,Any]:
     # Base price: pro-rate hourly base
@@ -36,24 +96,18 @@ def compute_price(db: Session, court: Court, start_ts: datetime.datetime, end_ts
     base = (court.base_hourly or 0) * duration_hours
     line_items = [{'name': f'Court {court.name} base', 'amount': base}]
 
-    # gather rules
-    rules = db.query(PricingRule).filter(PricingRule.enabled == True).all()
-    applicable = []
-    target = {'type': court.type.value if hasattr(court.type,'value') else court.type}
-    for r in rules:
-        if rule_applies(r.rule_json, target, start_ts, end_ts):
-            applicable.append({'priority': r.priority, 'rule': r})
-
-    applicable.sort(key=lambda x: x['priority'], reverse=True)
+    # gather rules (already in priority order)
+    court_type = court.type.value if hasattr(court.type,'value') else court.type
+    weekday_bit = 1 << start_ts.weekday()
+    second_of_day = start_ts.hour * 3600 + start_ts.minute * 60 + start_ts.second
+    applicable = [r for r in get_active_rules(db) if rule_applies(r, weekday_bit, second_of_day, court_type)]
 
     total = base
     breakdown_rules = []
-    for ar in applicable:
-        r = ar['rule']
-        mod = r.rule_json.get('modifier', {})
-        typ = mod.get('type')
-        val = mod.get('value', 0)
-        stack = r.rule_json.get('stack_behavior', 'additive')
+    for r in applicable:
+        typ = r.modifier_type
+        val = r.value
+        stack = r.stack
         if typ == 'percentage':
             if stack == 'additive':
                 delta = total * (val/100.0)
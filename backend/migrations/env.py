@@ -0,0 +1,30 @@
+"""
+Alembic environment. init_database passes in its own locked connection;
+the alembic command line connects through backend.db instead.
+"""
+from logging.config import fileConfig
+
+from alembic import context
+
+config = context.config
+
+
+def run_migrations(connection, target_metadata=None):
+    # One transaction per revision; an autocommit block then only commits revisions already applied
+    context.configure(connection=connection, target_metadata=target_metadata, transaction_per_migration=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+connection = config.attributes.get('connection')
+if connection is not None:
+    run_migrations(connection)
+else:
+    if config.config_file_name:
+        fileConfig(config.config_file_name)
+    from backend.db import engine
+    from backend.models import Base
+
+    with engine.connect() as connection:
+        run_migrations(connection, Base.metadata)
+        connection.commit()
@@ -0,0 +1,94 @@
+"""
+Key waitlist entries by court and time window instead of slot_hash.
+
+slot_hash was "<start iso>_<end iso>_<court id>"; existing entries are
+parsed into court_id, start_ts and end_ts so nobody loses their place.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+waitlist = sa.table(
+    'waitlist_entries',
+    sa.column('id', sa.Integer),
+    sa.column('slot_hash', sa.String),
+    sa.column('court_id', sa.Integer),
+    sa.column('start_ts', sa.DateTime),
+    sa.column('end_ts', sa.DateTime),
+)
+
+
+def parse_slot_hash(slot_hash):
+    try:
+        start, end, court_id = slot_hash.split('_')
+        return int(court_id), datetime.datetime.fromisoformat(start), datetime.datetime.fromisoformat(end)
+    except (AttributeError, ValueError):
+        return None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'slot_hash' not in {c['name'] for c in inspector.get_columns('waitlist_entries')}:
+        return  # created from the current models
+    slot_indexes = [
+        ix['name'] for ix in inspector.get_indexes('waitlist_entries') if 'slot_hash' in ix['column_names']
+    ]
+
+    # Batch mode rebuilds the table on SQLite, which cannot ALTER in a foreign key
+    with op.batch_alter_table('waitlist_entries') as batch:
+        batch.add_column(sa.Column('court_id', sa.Integer))
+        batch.add_column(sa.Column('start_ts', sa.DateTime))
+        batch.add_column(sa.Column('end_ts', sa.DateTime))
+        batch.create_foreign_key('waitlist_entries_court_id_fkey', 'courts', ['court_id'], ['id'])
+
+    bind = op.get_bind()
+    court_ids = set(bind.execute(sa.text('SELECT id FROM courts')).scalars())
+    rows = bind.execute(sa.select(waitlist.c.id, waitlist.c.slot_hash)).all()
+    for entry_id, slot_hash in rows:
+        parsed = parse_slot_hash(slot_hash)
+        if parsed is None or parsed[0] not in court_ids:
+            continue  # matches no bookable slot; left unkeyed
+        court_id, start_ts, end_ts = parsed
+        op.execute(
+            waitlist.update().where(waitlist.c.id == entry_id)
+            .values(court_id=court_id, start_ts=start_ts, end_ts=end_ts)
+        )
+
+    with op.batch_alter_table('waitlist_entries') as batch:
+        for name in slot_indexes:
+            batch.drop_index(name)
+        batch.drop_column('slot_hash')
+        batch.create_index('ix_waitlist_slot_created', ['court_id', 'start_ts', 'end_ts', 'created_at'])
+
+
+def downgrade():
+    with op.batch_alter_table('waitlist_entries') as batch:
+        batch.add_column(sa.Column('slot_hash', sa.String))
+
+    rows = op.get_bind().execute(
+        sa.select(waitlist.c.id, waitlist.c.court_id, waitlist.c.start_ts, waitlist.c.end_ts)
+        .where(waitlist.c.court_id.is_not(None))
+    ).all()
+    for entry_id, court_id, start_ts, end_ts in rows:
+        op.execute(
+            waitlist.update().where(waitlist.c.id == entry_id)
+            .values(slot_hash=f'{start_ts.isoformat()}_{end_ts.isoformat()}_{court_id}')
+        )
+
+    # Dropping court_id also drops its foreign key
+    with op.batch_alter_table('waitlist_entries') as batch:
+        batch.drop_index('ix_waitlist_slot_created')
+        batch.drop_column('court_id')
+        batch.drop_column('start_ts')
+        batch.drop_column('end_ts')
+        batch.create_index('ix_waitlist_slot_created', ['slot_hash', 'created_at'])
@@ -0,0 +1,60 @@
+"""
+Give bookings a court_id and, on PostgreSQL, the no_double_booking constraint.
+
+court_id is backfilled from each booking's court allocation. The exclusion
+constraint cannot be added while confirmed bookings of one court overlap;
+the upgrade stops and names them so they can be cancelled or moved first.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+OVERLAPPING_CONFIRMED = sa.text(
+    "SELECT a.id, b.id FROM bookings a JOIN bookings b "
+    "ON a.court_id = b.court_id AND a.id < b.id AND a.start_ts < b.end_ts AND b.start_ts < a.end_ts "
+    "WHERE a.status = 'confirmed' AND b.status = 'confirmed'"
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'court_id' not in {c['name'] for c in sa.inspect(bind).get_columns('bookings')}:
+        if bind.dialect.name == 'sqlite':
+            # SQLite cannot ALTER in a foreign key, and rebuilding bookings in
+            # batch mode would trip the foreign keys that point at it
+            op.add_column('bookings', sa.Column('court_id', sa.Integer))
+        else:
+            op.add_column('bookings', sa.Column('court_id', sa.Integer, sa.ForeignKey('courts.id', name='bookings_court_id_fkey')))
+        op.execute(
+            "UPDATE bookings SET court_id = ("
+            "SELECT a.resource_id FROM booking_allocations a "
+            "WHERE a.booking_id = bookings.id AND a.resource_type = 'court' ORDER BY a.id LIMIT 1)"
+        )
+
+    if bind.dialect.name != 'postgresql':
+        return
+    if bind.execute(sa.text("SELECT 1 FROM pg_constraint WHERE conname = 'no_double_booking'")).first():
+        return
+    overlaps = bind.execute(OVERLAPPING_CONFIRMED).all()
+    if overlaps:
+        pairs = ', '.join(f'{a}/{b}' for a, b in overlaps)
+        raise RuntimeError(f'Confirmed bookings overlap on the same court ({pairs}); cancel or move them, then upgrade again')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute(
+        "ALTER TABLE bookings ADD CONSTRAINT no_double_booking EXCLUDE USING gist "
+        "(court_id WITH =, tsrange(start_ts, end_ts, '[)') WITH &&) WHERE (status = 'confirmed')"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE bookings DROP CONSTRAINT IF EXISTS no_double_booking')
+    op.drop_column('bookings', 'court_id')
@@ -0,0 +1,62 @@
+"""
+Build the query indexes declared on the models since the initial schema.
+
+create_all never adds an index to a table that already exists. On
+PostgreSQL the indexes are built CONCURRENTLY, outside the migration
+transaction, so bookings stay writable while they build.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15
+"""
+from contextlib import nullcontext
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns) as declared in backend/models.py
+INDEXES = [
+    ('ix_booking_window_status', 'bookings', ['start_ts', 'end_ts', 'status']),
+    # Rebuilt if it still has the two columns it was first declared with
+    ('ix_alloc_resource', 'booking_allocations', ['resource_type', 'resource_id', 'booking_id']),
+    ('ix_bookings_status_created', 'bookings', ['status', 'created_at']),
+    ('ix_bookings_status_start', 'bookings', ['status', 'start_ts']),
+    ('ix_alloc_booking', 'booking_allocations', ['booking_id']),
+    ('ix_coach_avail_day', 'coach_availability', ['coach_id', 'day_of_week']),
+    ('ix_bookings_user_status', 'bookings', ['user_id', 'status']),
+    ('ix_bookings_created_id', 'bookings', ['created_at', 'id']),
+]
+
+
+def outside_transaction():
+    """CREATE INDEX CONCURRENTLY cannot run inside a transaction block."""
+    if op.get_bind().dialect.name == 'postgresql':
+        return op.get_context().autocommit_block()
+    return nullcontext()
+
+
+def ensure_index(name, table, columns):
+    """Create an index, rebuilding one of the same name with other columns."""
+    existing = {ix['name']: ix['column_names'] for ix in sa.inspect(op.get_bind()).get_indexes(table)}
+    if existing.get(name) == columns:
+        return
+    with outside_transaction():
+        if name in existing:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+        op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        ensure_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        with outside_transaction():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
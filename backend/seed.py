@@ -3,41 +3,33 @@ from typing import Optional
 from backend.db import engine, SessionLocal
 from backend.models import Base, Court, EquipmentItem, Coach, PricingRule, CoachAvailability, User
 from backend.auth import hash_password
+from backend.pricing import invalidate_rules
 import sqlalchemy
+from sqlalchemy import insert, select
 import json
 
+def _missing(db, column, rows, key):
+    # one IN query per table instead of a lookup per row
+    existing = set(db.scalars(select(column).where(column.in_([r[key] for r in rows]))))
+    return [r for r in rows if r[key] not in existing]
+
 def seed_data(db_sess = None):
     # create tables
     Base.metadata.create_all(bind=engine)
     db = db_sess or SessionLocal()
 
-    # Create admin user
-    admin_exists = db.query(User).filter(User.email == 'admin@courtbook.com').first()
-    if not admin_exists:
-        admin = User(
-            name='Admin User',
-            email='admin@courtbook.com',
-            phone='+1234567890',
-            password_hash=hash_password('Admin123!'),
-            role='admin',
-            is_active=True,
-            email_verified=True
-        )
-        db.add(admin)
-    
-    # Create demo customer user
-    demo_exists = db.query(User).filter(User.email == 'demo@courtbook.com').first()
-    if not demo_exists:
-        demo = User(
-            name='Demo User',
-            email='demo@courtbook.com',
-            phone='+1987654321',
-            password_hash=hash_password('Demo123!'),
-            role='customer',
-            is_active=True,
-            email_verified=True
-        )
-        db.add(demo)
+    # Create admin and demo customer users; only hash passwords that get stored
+    users = [
+        {'name':'Admin User','email':'admin@courtbook.com','phone':'+1234567890','password':'Admin123!','role':'admin'},
+        {'name':'Demo User','email':'demo@courtbook.com','phone':'+1987654321','password':'Demo123!','role':'customer'},
+    ]
+    new_users = [
+        {'name':u['name'], 'email':u['email'], 'phone':u['phone'], 'password_hash':hash_password(u['password']),
+         'role':u['role'], 'is_active':True, 'email_verified':True}
+        for u in _missing(db, User.email, users, 'email')
+    ]
+    if new_users:
+        db.execute(insert(User), new_users)
 
     # courts
     courts = [
@@ -46,22 +38,18 @@ def seed_data(db_sess = None):
         {'name':'court_3','type':'outdoor','base_hourly':400},
         {'name':'court_4','type':'outdoor','base_hourly':400},
     ]
-    for c in courts:
-        exists = db.query(Court).filter(Court.name==c['name']).first()
-        if not exists:
-            court = Court(name=c['name'], type=c['type'], base_hourly=c['base_hourly'])
-            db.add(court)
+    new_courts = _missing(db, Court.name, courts, 'name')
+    if new_courts:
+        db.execute(insert(Court), new_courts)
 
     # equipment
     eq = [
         {'sku':'racket','name':'Racket','total_quantity':10},
         {'sku':'shoes','name':'Shoes','total_quantity':8}
     ]
-    for e in eq:
-        exists = db.query(EquipmentItem).filter(EquipmentItem.sku==e['sku']).first()
-        if not exists:
-            item = EquipmentItem(sku=e['sku'], name=e['name'], total_quantity=e['total_quantity'])
-            db.add(item)
+    new_eq = _missing(db, EquipmentItem.sku, eq, 'sku')
+    if new_eq:
+        db.execute(insert(EquipmentItem), new_eq)
 
     # coaches
     coaches = [
@@ -69,31 +57,22 @@ def seed_data(db_sess = None):
         {'name':'Coach B','hourly_rate':250},
         {'name':'Coach C','hourly_rate':200}
     ]
-    for c in coaches:
-        exists = db.query(Coach).filter(Coach.name==c['name']).first()
-        if not exists:
-            coach = Coach(name=c['name'], hourly_rate=c['hourly_rate'])
-            db.add(coach)
-    
-    db.commit()  # commit coaches first to get their IDs
+    new_coaches = _missing(db, Coach.name, coaches, 'name')
+    if new_coaches:
+        db.execute(insert(Coach), new_coaches)
     
     # coach availability (Mon-Sat, 8am-8pm for all coaches)
     days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
-    all_coaches = db.query(Coach).all()
-    for coach in all_coaches:
-        for day in days:
-            exists = db.query(CoachAvailability).filter(
-                CoachAvailability.coach_id == coach.id,
-                CoachAvailability.day_of_week == day
-            ).first()
-            if not exists:
-                avail = CoachAvailability(
-                    coach_id=coach.id,
-                    day_of_week=day,
-                    start_time='08:00',
-                    end_time='20:00'
-                )
-                db.add(avail)
+    coach_ids = db.scalars(select(Coach.id)).all()
+    existing = {tuple(row) for row in db.execute(select(CoachAvailability.coach_id, CoachAvailability.day_of_week))}
+    availability = [
+        {'coach_id':coach_id, 'day_of_week':day, 'start_time':'08:00', 'end_time':'20:00'}
+        for coach_id in coach_ids
+        for day in days
+        if (coach_id, day) not in existing
+    ]
+    if availability:
+        db.execute(insert(CoachAvailability), availability)
 
     # pricing rules
     rules = [
@@ -113,13 +92,13 @@ def seed_data(db_sess = None):
             'applies_to':'court'
         }
     ]
-    for r in rules:
-        exists = db.query(PricingRule).filter(PricingRule.name==r['name']).first()
-        if not exists:
-            pr = PricingRule(name=r['name'], enabled=r['enabled'], priority=r['priority'], rule_json=r['rule_json'], applies_to=r['applies_to'])
-            db.add(pr)
+    new_rules = _missing(db, PricingRule.name, rules, 'name')
+    if new_rules:
+        db.execute(insert(PricingRule), new_rules)
 
     db.commit()
+    if new_rules:
+        invalidate_rules()  # Core inserts bypass the session's rule tracking
     print('seed complete')
 
 if __name__ == '__main__':
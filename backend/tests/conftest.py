@@ -0,0 +1,138 @@
+"""
+Shared database fixtures: the schema is built and seeded once per run, and
+each test gets the seed rows restored into freshly emptied tables.
+"""
+import hashlib
+import os
+import pickle
+
+# Every pytest-xdist worker (or a plain run) gets its own SQLite file; this
+# must be set before backend.db builds the engine
+TEST_DATABASE_URL = f"sqlite:///./test_{os.getenv('PYTEST_XDIST_WORKER', 'main')}.db"
+os.environ.setdefault('DATABASE_URL', TEST_DATABASE_URL)
+# The concurrency tests hold more connections at once than the default pool allows
+os.environ.setdefault('DB_POOL_SIZE', '20')
+os.environ.setdefault('DB_MAX_OVERFLOW', '30')
+
+import pytest
+from sqlalchemy import event, select, text
+from backend import auth, models
+from backend.db import SessionLocal, engine
+from backend.models import Base
+from backend.pricing import invalidate_rules
+from backend.seed import seed_data
+from fastapi.testclient import TestClient
+from backend.main import app, LIST_VERSIONS, bump_list_version
+
+
+if engine.url.render_as_string() == TEST_DATABASE_URL:
+    # A throwaway file needs no durability: skip fsync and keep rollback journals in memory.
+    # It stays a file rather than :memory: so concurrent requests get their own connections.
+    @event.listens_for(engine, 'connect')
+    def skip_durability(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA synchronous=OFF')
+        cursor.execute('PRAGMA journal_mode=MEMORY')
+        cursor.close()
+
+
+def clear_tables():
+    """Delete every row so the next test starts from an empty schema with fresh ids."""
+    with engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            names = ', '.join(t.name for t in Base.metadata.sorted_tables)
+            conn.execute(text(f'TRUNCATE {names} RESTART IDENTITY CASCADE'))
+        else:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+
+
+@pytest.fixture(scope='session')
+def schema():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    if engine.url.render_as_string() == TEST_DATABASE_URL:
+        engine.dispose()
+        os.remove(engine.url.database)
+
+
+def seed_fingerprint():
+    """Hash the sources that decide what seed_data writes, so a stale snapshot is never reused."""
+    digest = hashlib.sha256()
+    for path in (seed_data.__code__.co_filename, models.__file__, auth.__file__, __file__):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+@pytest.fixture(scope='session')
+def seed_rows(request, schema):
+    """
+    Run seed_data once (password hashing dominates its cost) and keep its rows.
+    The rows are also kept in pytest's cache directory, so later runs skip
+    seeding until seed.py, models.py or auth.py change. Server-stamped columns
+    such as created_at are left out, so every restore stamps them afresh.
+    """
+    cache = getattr(request.config, 'cache', None)  # absent under -p no:cacheprovider
+    path = cache.mkdir('seed') / f'{seed_fingerprint()}.pickle' if cache is not None else None
+    if path is not None and path.exists():
+        with open(path, 'rb') as f:
+            rows = pickle.load(f)
+    else:
+        session = SessionLocal()
+        seed_data(session)
+        session.close()
+        with engine.connect() as conn:
+            rows = []
+            for table in Base.metadata.sorted_tables:
+                kept = [c for c in table.c if c.server_default is None]
+                rows.append((table.name, [dict(row) for row in conn.execute(select(*kept)).mappings()]))
+        clear_tables()
+        if path is not None:
+            with open(path, 'wb') as f:
+                pickle.dump(rows, f)
+    return [(Base.metadata.tables[name], table_rows) for name, table_rows in rows]
+
+
+def clear_auth_caches():
+    """Forget decoded tokens and user snapshots; ids restart from 1 in every test."""
+    auth._decode_cache.clear()
+    auth._user_cache.clear()
+
+
+@pytest.fixture
+def empty_db(schema):
+    clear_auth_caches()
+    session = SessionLocal()
+    yield session
+    session.close()
+    clear_tables()
+    clear_auth_caches()
+
+
+@pytest.fixture
+def db(empty_db, seed_rows):
+    with engine.begin() as conn:
+        for table, rows in seed_rows:
+            if not rows:
+                continue
+            conn.execute(table.insert(), rows)
+            if conn.dialect.name == 'postgresql' and 'id' in table.c:
+                # explicit ids do not advance the serial sequence
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), {max(r['id'] for r in rows)})"))
+    invalidate_rules()
+    bump_list_version(*LIST_VERSIONS)  # seeded outside the admin endpoints
+    return empty_db
+
+
+@pytest.fixture(scope='session')
+def app_client():
+    # Deliberately not entered as a context manager: the lifespan startup would
+    # run init_database and seed the app's own demo data over the fixtures
+    return TestClient(app)
+
+
+@pytest.fixture
+def client(db, app_client):
+    return app_client
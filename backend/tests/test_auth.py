@@ -0,0 +1,157 @@
+"""
+Authentication tests: token handling and password hashing.
+"""
+import datetime
+import os
+import pathlib
+import subprocess
+import sys
+import pytest
+from backend import auth
+from backend.models import User
+
+
+@pytest.fixture
+def db(empty_db):
+    # Auth tests register their own users on an unseeded schema
+    return empty_db
+
+
+def register(client, email='player@example.com'):
+    resp = client.post('/api/auth/register', json={
+        'email': email,
+        'password': 'Secret123',
+        'name': 'Player One'
+    })
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_decode_token_roundtrip():
+    """Test an issued access token decodes back to its claims."""
+    token = auth.create_access_token(data={"sub": "42"})
+    payload = auth.decode_token(token)
+    assert payload["sub"] == "42"
+    assert payload["type"] == "access"
+
+
+def test_decode_token_served_from_cache(monkeypatch):
+    """Test a repeated decode of the same token skips signature verification."""
+    token = auth.create_access_token(data={"sub": "7"})
+    first = auth.decode_token(token)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the token should not be verified again on a cache hit")
+
+    monkeypatch.setattr(auth, "_fast_decode", fail)
+    assert auth.decode_token(token) == first
+
+
+def test_decode_token_rejects_expired_and_invalid():
+    """Test expired and malformed tokens are rejected and not cached."""
+    expired = auth.create_access_token(data={"sub": "1"}, expires_delta=datetime.timedelta(seconds=-1))
+    cached = len(auth._decode_cache)
+    assert auth.decode_token(expired) is None
+    assert auth.decode_token("not-a-token") is None
+    assert len(auth._decode_cache) == cached
+
+
+def test_current_user_snapshot_cached(client, db):
+    """Test the authenticated user is cached and invalidated on profile update."""
+    tokens = register(client)
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+    user_id = tokens['user']['id']
+    assert auth.decode_token(tokens['access_token'])['sub'] == str(user_id)
+    # Standard decoders validate sub as a string too
+    assert auth.jwt.decode(tokens['access_token'], auth.SECRET_KEY, algorithms=[auth.ALGORITHM])['sub'] == str(user_id)
+
+    assert client.get('/api/auth/me', headers=headers).json()['name'] == 'Player One'
+    assert auth._user_cache[user_id].role == 'customer'
+
+    client.put('/api/auth/me?name=Renamed', headers=headers)
+    assert user_id not in auth._user_cache
+    assert client.get('/api/auth/me', headers=headers).json()['name'] == 'Renamed'
+    assert auth._user_cache[user_id].name == 'Renamed'
+
+
+def test_legacy_pbkdf2_hash_migrated_on_login(client, db):
+    """Test a legacy salt$hash password still logs in and is rehashed with argon2id."""
+    salt = 'a' * 32
+    digest = auth.hashlib.pbkdf2_hmac('sha256', b'Secret123', salt.encode('utf-8'), 100000).hex()
+    db.add(User(name='Legacy', email='legacy@example.com', password_hash=f'{salt}${digest}'))
+    db.commit()
+
+    resp = client.post('/api/auth/login', json={'email': 'legacy@example.com', 'password': 'Secret123'})
+    assert resp.status_code == 200
+
+    db.expire_all()
+    user = db.query(User).filter(User.email == 'legacy@example.com').first()
+    assert user.password_hash.startswith('$argon2id$')
+    assert auth.verify_password('Secret123', user.password_hash)
+    assert not auth.verify_password('Wrong1234', user.password_hash)
+
+
+def test_unknown_email_still_verifies_password(db, monkeypatch):
+    """Test authenticate_user runs a hash check even when the email is unknown."""
+    calls = []
+    real_verify = auth.verify_password
+    monkeypatch.setattr(auth, 'verify_password', lambda pw, h: calls.append(h) or real_verify(pw, h))
+
+    assert auth.authenticate_user(db, 'nobody@example.com', 'Secret123') is None
+    assert calls == [auth._DUMMY_HASH]
+
+
+def test_missing_or_non_bearer_authorization_rejected(client, db):
+    """Test requests without a Bearer token are rejected with 401."""
+    assert client.get('/api/auth/me').status_code == 401
+    assert client.get('/api/auth/me', headers={'Authorization': 'Basic abc'}).status_code == 401
+
+    tokens = register(client)
+    headers = {'Authorization': f"bearer {tokens['access_token']}"}
+    assert client.get('/api/auth/me', headers=headers).status_code == 200
+
+
+def test_bcrypt_hash_still_verifies_and_needs_rehash():
+    """Test bcrypt hashes from before the argon2 switch verify and are flagged for upgrade."""
+    bcrypt_hash = auth.pwd_context.handler('bcrypt').using(rounds=4).hash('Secret123')
+    assert auth.verify_password('Secret123', bcrypt_hash)
+    assert auth.password_needs_rehash(bcrypt_hash)
+    assert not auth.password_needs_rehash(auth.hash_password('Secret123'))
+
+
+def test_change_password(client, db):
+    """Test change-password checks the old password and stores the new one."""
+    tokens = register(client)
+    headers = {'Authorization': f"Bearer {tokens['access_token']}"}
+
+    wrong = client.post('/api/auth/change-password', headers=headers,
+                        json={'old_password': 'Wrong1234', 'new_password': 'Newpass123'})
+    assert wrong.status_code == 400
+
+    resp = client.post('/api/auth/change-password', headers=headers,
+                       json={'old_password': 'Secret123', 'new_password': 'Newpass123'})
+    assert resp.status_code == 200
+    login = client.post('/api/auth/login', json={'email': 'player@example.com', 'password': 'Newpass123'})
+    assert login.status_code == 200
+
+
+def test_token_claims_follow_role_change(db):
+    """Test token claims are read from the user's current fields, not a stale snapshot."""
+    user = User(name='Player', email='claims@example.com', role='customer')
+    db.add(user)
+    db.flush()
+    assert auth.generate_tokens(user).user['role'] == 'customer'
+    user.role = 'admin'
+    assert auth.generate_tokens(user).user['role'] == 'admin'
+
+
+def test_multiple_workers_require_jwt_secret():
+    """Test startup fails when several workers would each generate their own signing key."""
+    env = {k: v for k, v in os.environ.items() if k != 'JWT_SECRET_KEY'}
+    env['WEB_CONCURRENCY'] = '2'
+    result = subprocess.run(
+        [sys.executable, '-c', 'import backend.auth'],
+        cwd=pathlib.Path(auth.__file__).parents[1], env=env, capture_output=True, text=True
+    )
+    assert result.returncode != 0
+    assert 'JWT_SECRET_KEY must be set' in result.stderr
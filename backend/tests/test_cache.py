@@ -0,0 +1,47 @@
+"""
+SieveCache tests: eviction order and per-entry expiry.
+"""
+from backend.cache import SieveCache
+
+
+def test_sieve_evicts_unvisited_before_visited():
+    """Test a visited entry survives eviction while an unvisited one is dropped."""
+    cache = SieveCache(maxsize=3)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    assert cache.get('a') == 1  # mark oldest as visited
+
+    cache['d'] = 4
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert len(cache) == 3
+
+
+def test_sieve_sweeps_all_visited_entries():
+    """Test eviction still succeeds when every entry has been visited."""
+    cache = SieveCache(maxsize=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache.get('a')
+    cache.get('b')
+
+    cache['c'] = 3
+    assert len(cache) == 2
+    assert cache.get('c') == 3
+
+
+def test_sieve_per_entry_expiry():
+    """Test entries disappear once the ttu-computed expiry has passed."""
+    now = [100.0]
+    cache = SieveCache(maxsize=10, ttu=lambda key, value, t: t + value, timer=lambda: now[0])
+    cache['short'] = 5
+    cache['long'] = 50
+
+    now[0] = 110.0
+    assert cache.get('short') is None
+    assert cache.get('long') == 50
+    assert len(cache) == 1
+
+    assert cache.pop('long') == 50
+    assert len(cache) == 0
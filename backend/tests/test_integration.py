@@ -1,31 +1,25 @@
 """
 Booking integration tests: end-to-end workflow validation.
 """
+import asyncio
 import datetime
 import pytest
-from backend.db import SessionLocal, engine
-from backend.models import Base, Booking, User
-from backend.seed import seed_data
-from fastapi.testclient import TestClient
-from backend.main import app
-
-@pytest.fixture(scope='function')
-def db():
-    Base.metadata.create_all(bind=engine)
-    session = SessionLocal()
-    seed_data(session)
-    yield session
-    session.close()
-    Base.metadata.drop_all(bind=engine)
-
-@pytest.fixture
-def client(db):
-    return TestClient(app)
+from sqlalchemy import event
+from backend.db import engine
+from backend.models import User
+from backend.main import manager, ConnectionManager, acquire_stats_refresh_lock, refresh_booking_stats, release_stats_refresh_lock
+
+# Fixed future week starting on a Monday, so weekday-dependent rules and coach
+# hours behave the same on every run; slot(2, 10) is Wednesday 10:00
+BASE = datetime.datetime(2030, 1, 7)
+
+def slot(day, hour):
+    return BASE + datetime.timedelta(days=day, hours=hour)
 
 def test_full_booking_flow(client, db):
     """End-to-end: user books court + equipment + coach successfully."""
-    start = (datetime.datetime.utcnow() + datetime.timedelta(days=5)).replace(hour=18, minute=0, second=0, microsecond=0).isoformat()
-    end = (datetime.datetime.utcnow() + datetime.timedelta(days=5)).replace(hour=19, minute=0, second=0, microsecond=0).isoformat()
+    start = slot(5, 18).isoformat()
+    end = slot(5, 19).isoformat()
     
     payload = {
         'user_email': 'john@example.com',
@@ -44,9 +38,39 @@ def test_full_booking_flow(client, db):
     assert result['total'] > 0
     assert 'pricing' in result
 
+def test_coach_double_booking_rejected(client, db):
+    """Test the same coach cannot be booked on two courts at the same time."""
+    start = slot(5, 10)  # Saturday; coaches are available Monday-Saturday only
+    end = start + datetime.timedelta(hours=1)
+    
+    base = {'start_ts': start.isoformat(), 'end_ts': end.isoformat(), 'equipment': [], 'coach_id': 1}
+    first = client.post('/api/bookings', json={**base, 'user_email': 'c1@example.com', 'court_id': 1})
+    assert first.json()['status'] == 'confirmed'
+    
+    second = client.post('/api/bookings', json={**base, 'user_email': 'c2@example.com', 'court_id': 2})
+    assert second.status_code == 400
+    assert 'Coach already booked' in second.json()['detail']
+
+def test_equipment_quantity_limit_enforced(client, db):
+    """Test equipment already rented for an overlapping slot reduces what is left."""
+    start = slot(9, 12)
+    end = start + datetime.timedelta(hours=1)
+    base = {'start_ts': start.isoformat(), 'end_ts': end.isoformat()}
+    
+    # Seeded stock is 8 pairs of shoes
+    first = client.post('/api/bookings', json={**base, 'user_email': 'e1@example.com', 'court_id': 1, 'equipment': [{'sku': 'shoes', 'quantity': 6}]})
+    assert first.json()['status'] == 'confirmed'
+    
+    second = client.post('/api/bookings', json={**base, 'user_email': 'e2@example.com', 'court_id': 2, 'equipment': [{'sku': 'shoes', 'quantity': 3}]})
+    assert second.status_code == 400
+    assert 'Available: 2' in second.json()['detail']
+    
+    third = client.post('/api/bookings', json={**base, 'user_email': 'e3@example.com', 'court_id': 3, 'equipment': [{'sku': 'shoes', 'quantity': 2}]})
+    assert third.json()['status'] == 'confirmed'
+
 def test_availability_query(client, db):
     """Test availability endpoint returns correct slot status."""
-    start = (datetime.datetime.utcnow() + datetime.timedelta(days=6)).replace(hour=9, minute=0, second=0, microsecond=0)
+    start = slot(6, 9)
     end = start + datetime.timedelta(hours=1)
     
     # Check availability
@@ -58,10 +82,33 @@ def test_availability_query(client, db):
     assert 'coaches' in result
     assert len(result['available_courts']) > 0
 
+def test_availability_excludes_booked_court(client, db):
+    """Test a court with a confirmed overlapping booking is not listed as available."""
+    start = slot(6, 13)
+    end = start + datetime.timedelta(hours=1)
+    
+    resp = client.post('/api/bookings', json={'user_email': 'avail@example.com', 'start_ts': start.isoformat(), 'end_ts': end.isoformat(), 'court_id': 2, 'equipment': []})
+    assert resp.json()['status'] == 'confirmed'
+    
+    # Query a window that partially overlaps the booking
+    window_start = start + datetime.timedelta(minutes=30)
+    result = client.get(f'/api/availability?start_ts={window_start.isoformat()}&end_ts={(window_start + datetime.timedelta(hours=1)).isoformat()}').json()
+    court_ids = [c['court_id'] for c in result['available_courts']]
+    assert 2 not in court_ids
+    assert 1 in court_ids
+
+def test_slots_for_date(client, db):
+    """Test the day grid has 26 half-hour slots from 08:00 to 21:00."""
+    result = client.get('/api/slots/2025-12-15').json()
+    assert result['date'] == '2025-12-15'
+    assert len(result['slots']) == 26
+    assert result['slots'][0] == {'start': '2025-12-15T08:00:00', 'end': '2025-12-15T08:30:00'}
+    assert result['slots'][-1] == {'start': '2025-12-15T20:30:00', 'end': '2025-12-15T21:00:00'}
+
 def test_simulate_pricing_endpoint(client, db):
     """Test that /api/simulate-pricing returns correct breakdown."""
-    start = (datetime.datetime.utcnow() + datetime.timedelta(days=7)).replace(hour=19, minute=0, second=0, microsecond=0).isoformat()
-    end = (datetime.datetime.utcnow() + datetime.timedelta(days=7)).replace(hour=20, minute=0, second=0, microsecond=0).isoformat()
+    start = slot(7, 19).isoformat()
+    end = slot(7, 20).isoformat()
     
     resp = client.get(f'/api/simulate-pricing?start_ts={start}&end_ts={end}&court_id=1')
     result = resp.json()
@@ -71,10 +118,23 @@ def test_simulate_pricing_endpoint(client, db):
     assert 'total' in result
     assert result['total'] >= result['base']
 
+def test_recommendations_quote_cheapest_court(client, db):
+    """Test the best value tip names the cheapest court at its rule-adjusted hourly price."""
+    resp = client.get('/api/recommendations?date=2030-01-12')  # a Saturday
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data['date'] == '2030-01-12'
+    
+    # Nothing is booked, so 8:00 is the quietest hour that the quote uses
+    quote = client.get(f'/api/simulate-pricing?start_ts={slot(5, 8).isoformat()}&end_ts={slot(5, 9).isoformat()}&court_id=3').json()
+    best_value = next(r for r in data['recommendations'] if r['type'] == 'best_value')
+    assert best_value['action'] == {'type': 'book_court', 'court_id': 3}
+    assert f"${quote['total']:g}/hour" in best_value['description']
+
 def test_booking_retrieval(client, db):
     """Test fetching booking details by ID."""
-    start = (datetime.datetime.utcnow() + datetime.timedelta(days=8)).replace(hour=11, minute=0, second=0, microsecond=0).isoformat()
-    end = (datetime.datetime.utcnow() + datetime.timedelta(days=8)).replace(hour=12, minute=0, second=0, microsecond=0).isoformat()
+    start = slot(8, 11).isoformat()
+    end = slot(8, 12).isoformat()
     
     # Create booking
     create_resp = client.post('/api/bookings', json={
@@ -127,3 +187,281 @@ def test_admin_pricing_rules_crud(client, db):
     }
     update_resp = client.put(f'/api/admin/pricing-rules/{rule_id}', json=updated_rule)
     assert update_resp.json()['status'] == 'updated'
+
+
+def test_websocket_subscription_cleanup(client, db):
+    """Test a date subscriber answers pings and is fully removed on disconnect."""
+    with client.websocket_connect('/ws/availability/2025-12-15') as ws:
+        ws.send_text('ping')
+        assert ws.receive_text() == 'pong'
+        assert '2025-12-15' in manager.subscriptions
+    
+    assert '2025-12-15' not in manager.subscriptions
+    assert not manager.active_connections
+    assert not manager.ws_dates
+
+
+class FakeSocket:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+    
+    async def accept(self):
+        pass
+    
+    async def send_text(self, text):
+        if self.fail:
+            raise RuntimeError('socket closed')
+        self.sent.append(text)
+
+def test_broadcast_drops_failed_sockets():
+    """Test a date broadcast reaches live sockets once and unsubscribes failing ones."""
+    mgr = ConnectionManager()
+    live, dead = FakeSocket(), FakeSocket(fail=True)
+    
+    async def run():
+        await mgr.connect(live, '2025-12-15')
+        await mgr.connect(dead, '2025-12-15')
+        await mgr.broadcast_to_date('2025-12-15', {'type': 'availability_update', 'booking_id': 1})
+    
+    asyncio.run(run())
+    assert live.sent == ['{"type":"availability_update","booking_id":1}']
+    assert mgr.subscriptions['2025-12-15'] == {live}
+    assert dead not in mgr.active_connections
+
+@pytest.mark.parametrize('path, new_item, expected', [
+    ('coaches', {'name': 'Coach New', 'hourly_rate': 150}, {'name': 'Coach New', 'hourly_rate': 150}),
+    ('courts', {'name': 'Court 5', 'type': 'outdoor', 'base_price': 350}, {'name': 'Court 5', 'base_price': 350}),
+    ('equipment', {'sku': 'grip', 'name': 'Grip Tape', 'total_quantity': 5, 'rental_price': 2}, {'name': 'Grip Tape', 'rental_price': 2}),
+])
+def test_admin_list_etag_and_invalidation(client, db, path, new_item, expected):
+    """Test admin lists answer 304 for a matching ETag and change after a mutation."""
+    first = client.get(f'/api/admin/{path}')
+    etag = first.headers['etag']
+    assert first.status_code == 200
+    
+    cached = client.get(f'/api/admin/{path}', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    
+    assert client.post(f'/api/admin/{path}', json=new_item).status_code == 200
+    fresh = client.get(f'/api/admin/{path}', headers={'If-None-Match': etag})
+    assert fresh.status_code == 200
+    assert fresh.headers['etag'] != etag
+    assert any(expected.items() <= item.items() for item in fresh.json())
+
+def test_cancel_promotes_first_waitlisted_user(client, db):
+    """Test cancelling a booking names the earliest waitlisted user for that slot."""
+    start = slot(6, 12).isoformat()
+    end = slot(6, 13).isoformat()
+    
+    booking = client.post('/api/bookings', json={'user_email': 'first@example.com', 'start_ts': start, 'end_ts': end, 'court_id': 2}).json()
+    assert client.post('/api/bookings', json={'user_email': 'other@example.com', 'start_ts': start, 'end_ts': end, 'court_id': 1}).json()['status'] == 'confirmed'
+    assert client.post('/api/bookings', json={'user_email': 'other@example.com', 'start_ts': start, 'end_ts': end, 'court_id': 1}).json()['status'] == 'waitlisted'
+    assert client.post('/api/bookings', json={'user_email': 'waiting@example.com', 'start_ts': start, 'end_ts': end, 'court_id': 2}).json()['status'] == 'waitlisted'
+    
+    result = client.post(f"/api/bookings/{booking['booking_id']}/cancel").json()
+    waiting = db.query(User).filter(User.email == 'waiting@example.com').one()
+    assert result == {'status': 'cancelled', 'next_waitlist_user_id': waiting.id}
+
+def test_cached_availability_refreshes_after_booking_changes(client, db):
+    """Test cached availability is dropped when a booking is made or cancelled."""
+    start = slot(8, 15)
+    end = start + datetime.timedelta(hours=1)
+    url = f'/api/availability?start_ts={start.isoformat()}&end_ts={end.isoformat()}'
+    
+    def court_ids():
+        return [c['court_id'] for c in client.get(url).json()['available_courts']]
+    
+    assert 3 in court_ids()
+    booking = client.post('/api/bookings', json={'user_email': 'cache@example.com', 'start_ts': start.isoformat(), 'end_ts': end.isoformat(), 'court_id': 3}).json()
+    assert 3 not in court_ids()
+    client.post(f"/api/bookings/{booking['booking_id']}/cancel")
+    assert 3 in court_ids()
+
+def test_booking_versions_prune_past_dates(monkeypatch):
+    """Test past dates leave the version map without their cached keys becoming reachable again."""
+    from backend import main
+    monkeypatch.setattr(main, 'BOOKING_VERSIONS', {'2020-01-01': 3})
+    monkeypatch.setattr(main, '_booking_version_floor', 0)
+    monkeypatch.setattr(main, '_booking_versions_pruned_on', None)
+    
+    main.bump_booking_version(slot(0, 10), slot(0, 11))
+    assert list(main.BOOKING_VERSIONS) == [BASE.date().isoformat()]
+    assert main.booking_version('2020-01-01') == 3
+    assert main.BOOKING_VERSIONS[BASE.date().isoformat()] == 4
+
+def test_list_bookings_query_count_independent_of_page_size(client, db):
+    """Test listing bookings does not issue a user lookup per row."""
+    for hour, email in ((9, 'a@example.com'), (10, 'b@example.com'), (11, 'c@example.com')):
+        start = slot(9, hour)
+        client.post('/api/bookings', json={'user_email': email, 'start_ts': start.isoformat(), 'end_ts': (start + datetime.timedelta(hours=1)).isoformat(), 'court_id': 1})
+    
+    queries = []
+    counter = lambda conn, cursor, statement, *args: queries.append(statement)
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        result = client.get('/api/bookings').json()
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+    
+    assert sorted(b['user_email'] for b in result['bookings']) == ['a@example.com', 'b@example.com', 'c@example.com']
+    assert all(b['allocations'] for b in result['bookings'])
+    assert len(queries) <= 3  # count, page with users, allocations
+
+def test_list_bookings_cursor_pagination(client, db):
+    """Test next_cursor pages through bookings newest first without repeats."""
+    for hour in (9, 10, 11):
+        start = slot(9, hour)
+        client.post('/api/bookings', json={'user_email': 'pager@example.com', 'start_ts': start.isoformat(), 'end_ts': (start + datetime.timedelta(hours=1)).isoformat(), 'court_id': 1})
+    
+    first = client.get('/api/bookings?limit=2').json()
+    second = client.get(f"/api/bookings?limit=2&cursor={first['next_cursor']}").json()
+    ids = [b['id'] for b in first['bookings'] + second['bookings']]
+    assert ids == sorted(ids, reverse=True) and len(ids) == 3
+    assert second['next_cursor'] is None
+    assert client.get('/api/bookings?cursor=not-a-cursor').status_code == 400
+
+def test_analytics_dashboard_counts(client, db):
+    """Test dashboard summary, per-court and per-coach counts and revenue trend."""
+    start = slot(9, 10)  # a Wednesday, inside coach hours
+    totals = []
+    for court_id, coach_id in ((1, 1), (1, None), (2, None)):
+        slot_start = start + datetime.timedelta(hours=len(totals) * 2)
+        resp = client.post('/api/bookings', json={'user_email': 'stats@example.com', 'start_ts': slot_start.isoformat(), 'end_ts': (slot_start + datetime.timedelta(hours=1)).isoformat(), 'court_id': court_id, 'coach_id': coach_id}).json()
+        assert resp['status'] == 'confirmed', resp
+        totals.append(resp['total'])
+    
+    data = client.get('/api/analytics/dashboard').json()
+    assert data['summary']['total_bookings'] == 3
+    assert data['summary']['weekly_bookings'] == 3
+    assert data['summary']['total_revenue'] == pytest.approx(sum(totals))
+    assert data['summary']['monthly_revenue'] == pytest.approx(sum(totals))
+    assert {c['id']: c['bookings'] for c in data['court_utilization']} == {1: 2, 2: 1, 3: 0, 4: 0}
+    assert {c['id']: c['sessions'] for c in data['coach_performance']}[1] == 1
+    assert len(data['revenue_trend']) == 7
+    assert data['revenue_trend'][-1]['date'] == datetime.datetime.utcnow().date().isoformat()
+    assert data['revenue_trend'][-1]['revenue'] == pytest.approx(sum(totals))
+
+@pytest.mark.skipif(engine.dialect.name != 'postgresql', reason='mv_booking_stats exists on PostgreSQL only')
+def test_dashboard_reads_refreshed_stats_view(client, db):
+    """Test one worker at a time refreshes the stats view and the dashboard serializes its sums."""
+    for court_id in (1, 2):
+        resp = client.post('/api/bookings', json={'user_email': 'stats@example.com', 'start_ts': slot(9, 10).isoformat(), 'end_ts': slot(9, 11).isoformat(), 'court_id': court_id}).json()
+        assert resp['status'] == 'confirmed', resp
+    
+    leader = acquire_stats_refresh_lock()
+    assert leader is not None
+    try:
+        assert acquire_stats_refresh_lock() is None
+        refresh_booking_stats(leader)
+    finally:
+        release_stats_refresh_lock(leader)
+    
+    resp = client.get('/api/analytics/dashboard')
+    assert resp.status_code == 200
+    assert resp.json()['peak_hours'][0] == {'hour': 10, 'count': 2}
+    
+    # Releasing the connection frees the lock for the next worker
+    successor = acquire_stats_refresh_lock()
+    assert successor is not None
+    release_stats_refresh_lock(successor)
+
+def test_user_analytics_aggregates(client, db):
+    """Test user analytics totals, hours played and favourite court."""
+    start = slot(11, 9)
+    totals = []
+    for offset, court_id, hours in ((0, 2, 1), (2, 1, 2), (5, 1, 1)):
+        slot_start = start + datetime.timedelta(hours=offset)
+        resp = client.post('/api/bookings', json={'user_email': 'fan@example.com', 'start_ts': slot_start.isoformat(), 'end_ts': (slot_start + datetime.timedelta(hours=hours)).isoformat(), 'court_id': court_id}).json()
+        totals.append(resp['total'])
+    user_id = db.query(User).filter(User.email == 'fan@example.com').one().id
+    
+    data = client.get(f'/api/analytics/user/{user_id}').json()
+    stats = data['stats']
+    assert stats['total_bookings'] == 3
+    assert stats['total_spent'] == pytest.approx(sum(totals))
+    assert stats['total_hours_played'] == 4.0
+    assert stats['favorite_court']['id'] == 1
+    assert stats['favorite_court']['visits'] == 2
+    assert data['loyalty']['points'] == 30 + int(sum(totals))
+    assert data['loyalty']['level'] == 'Gold'
+    assert data['loyalty']['next_level_at'] == 1000
+
+class FakeRedis:
+    """In-memory stand-in for the handful of Redis commands the app issues."""
+    
+    def __init__(self):
+        self.data = {}
+    
+    def get(self, key):
+        return self.data.get(key)
+    
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+    
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+    
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+    
+    def expire(self, key, ttl):
+        pass
+    
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+    
+    def pipeline(self):
+        return self
+    
+    def execute(self):
+        pass
+
+def test_recommendations_cached_until_booking(client, db, monkeypatch):
+    """Test recommendations are served from Redis and dropped when the user books."""
+    from backend import main
+    fake = FakeRedis()
+    monkeypatch.setattr(main, 'redis_client', fake)
+    url = '/api/recommendations?date=2030-01-12&user_email=reco@example.com'
+    
+    first = client.get(url)
+    assert first.status_code == 200
+    key = main.reco_cache_key(datetime.date(2030, 1, 12), 'reco@example.com')
+    assert fake.data[key] == first.content
+    
+    real_build = main.build_recommendations
+    def fail(*args):
+        raise AssertionError('recommendations rebuilt while cached')
+    monkeypatch.setattr(main, 'build_recommendations', fail)
+    assert client.get(url).content == first.content
+    
+    resp = client.post('/api/bookings', json={'user_email': 'reco@example.com', 'start_ts': slot(5, 10).isoformat(), 'end_ts': slot(5, 11).isoformat(), 'court_id': 1}).json()
+    assert resp['status'] == 'confirmed', resp
+    assert key not in fake.data
+    
+    monkeypatch.setattr(main, 'build_recommendations', real_build)
+    personalized = [r for r in client.get(url).json()['recommendations'] if r['type'] == 'personalized']
+    assert personalized[0]['action']['hour'] == 10
+
+def test_health_probe_memoized(client, monkeypatch):
+    """Test health checks within the probe TTL reuse the last database result."""
+    from backend import main
+    monkeypatch.setitem(main._health_cache, 'ts', float('-inf'))
+    assert client.get('/api/health').json()['services']['database'] == 'healthy'
+    
+    def fail():
+        raise AssertionError('database probed again within the TTL')
+    monkeypatch.setattr(main.db.engine, 'connect', fail)
+    assert client.get('/api/health').json()['status'] == 'ok'
+
+def test_init_database_seeds_once_when_workers_start_together(empty_db):
+    """Test concurrent startups create and seed the schema exactly once."""
+    from concurrent.futures import ThreadPoolExecutor
+    from backend import main
+    from backend.models import Court
+    
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(lambda _: main.init_database(), range(3)))
+    assert empty_db.query(Court).count() == 4
+    assert empty_db.query(User).count() == 2
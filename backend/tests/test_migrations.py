@@ -0,0 +1,112 @@
+"""
+Migration tests: databases created before a schema change upgrade in place.
+"""
+import datetime
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import Session
+from backend.main import migrate_database
+from backend.models import Base, Booking, WaitlistEntry
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """A throwaway SQLite file holding the current schema, for tests to roll back by hand."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    event.listen(engine, 'connect', lambda dbapi_connection, record: dbapi_connection.execute('PRAGMA foreign_keys=ON'))
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def upgrade(engine):
+    with engine.connect() as conn:
+        migrate_database(conn, fresh=False)
+        conn.commit()
+
+
+def create_slot_hash_waitlist(conn):
+    """Replace waitlist_entries with its layout from before court and time window columns."""
+    conn.execute(text('DROP TABLE waitlist_entries'))
+    conn.execute(text(
+        'CREATE TABLE waitlist_entries (id INTEGER PRIMARY KEY, slot_hash VARCHAR, '
+        'user_id INTEGER REFERENCES users (id), created_at DATETIME DEFAULT CURRENT_TIMESTAMP, '
+        'position INTEGER, notified_until_ts DATETIME)'
+    ))
+    conn.execute(text('CREATE INDEX ix_waitlist_slot_created ON waitlist_entries (slot_hash, created_at)'))
+
+
+def test_waitlist_slot_hash_migrated_to_court_window(legacy_engine):
+    """Test slot_hash waitlist entries keep their place as court and time window columns."""
+    with legacy_engine.begin() as conn:
+        create_slot_hash_waitlist(conn)
+        conn.execute(text("INSERT INTO courts (id, name, type) VALUES (2, 'Court 2', 'indoor')"))
+        conn.execute(text(
+            "INSERT INTO waitlist_entries (slot_hash, user_id) VALUES "
+            "('2030-01-08T14:00:00_2030-01-08T15:00:00_2', NULL), ('garbage', NULL), "
+            "('2030-01-08T14:00:00_2030-01-08T15:00:00_9', NULL)"
+        ))
+    
+    upgrade(legacy_engine)
+    
+    columns = {c['name'] for c in inspect(legacy_engine).get_columns('waitlist_entries')}
+    assert {'court_id', 'start_ts', 'end_ts'} <= columns and 'slot_hash' not in columns
+    with Session(legacy_engine) as session:
+        entries = session.query(WaitlistEntry).order_by(WaitlistEntry.id).all()
+        assert (entries[0].court_id, entries[0].start_ts, entries[0].end_ts) == (
+            2, datetime.datetime(2030, 1, 8, 14), datetime.datetime(2030, 1, 8, 15)
+        )
+        assert entries[1].court_id is None and entries[2].court_id is None  # unparsable, deleted court
+
+
+def test_upgrade_skips_schemas_built_from_current_models(legacy_engine):
+    """Test migrations leave a schema that create_all already built unchanged."""
+    upgrade(legacy_engine)
+    upgrade(legacy_engine)  # already at head
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text('SELECT version_num FROM alembic_version')).scalar() is not None
+
+
+def test_booking_court_id_backfilled_from_court_allocation(legacy_engine):
+    """Test bookings made before court_id existed get it from their court allocation."""
+    with legacy_engine.begin() as conn:
+        conn.execute(text('DROP TABLE bookings'))
+        conn.execute(text(
+            'CREATE TABLE bookings (id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users (id), '
+            'start_ts DATETIME, end_ts DATETIME, status VARCHAR, total_price FLOAT, pricing_snapshot JSON, '
+            'created_at DATETIME DEFAULT CURRENT_TIMESTAMP)'
+        ))
+        conn.execute(text("INSERT INTO courts (id, name, type) VALUES (3, 'Court 3', 'outdoor')"))
+        conn.execute(text("INSERT INTO bookings (id, status) VALUES (1, 'confirmed'), (2, 'confirmed')"))
+        conn.execute(text(
+            "INSERT INTO booking_allocations (booking_id, resource_type, resource_id, quantity) VALUES "
+            "(1, 'equipment', 7, 1), (1, 'court', 3, 1)"
+        ))
+    
+    upgrade(legacy_engine)
+    
+    with Session(legacy_engine) as session:
+        assert [b.court_id for b in session.query(Booking).order_by(Booking.id)] == [3, None]
+
+
+def test_upgrade_builds_every_declared_index(legacy_engine):
+    """Test a database from before the query indexes ends up with every index the models declare."""
+    declared = {
+        index.name: (table.name, [c.name for c in index.columns])
+        for table in Base.metadata.sorted_tables for index in table.indexes
+    }
+    with legacy_engine.begin() as conn:
+        create_slot_hash_waitlist(conn)
+        for name, (table, columns) in declared.items():
+            # Column-level index=True indexes predate the series
+            if table != 'waitlist_entries' and name != f'ix_{table}_{columns[0]}':
+                conn.execute(text(f'DROP INDEX {name}'))
+        # First declared without booking_id
+        conn.execute(text('CREATE INDEX ix_alloc_resource ON booking_allocations (resource_type, resource_id)'))
+    
+    upgrade(legacy_engine)
+    
+    inspector = inspect(legacy_engine)
+    for name, (table, columns) in declared.items():
+        built = {ix['name']: ix['column_names'] for ix in inspector.get_indexes(table)}
+        assert built.get(name) == columns, name
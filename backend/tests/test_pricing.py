@@ -1,94 +1,92 @@
 import datetime
 import pytest
-from backend.db import SessionLocal, engine
-from backend.models import Base, Court, PricingRule, CourtType
+from backend.db import engine
+from backend.models import Court, PricingRule, CourtType
 from backend.pricing import compute_price
-from backend.seed import seed_data
 
-@pytest.fixture(scope='function')
-def db():
-    """Setup and teardown DB for each test."""
-    Base.metadata.create_all(bind=engine)
-    session = SessionLocal()
-    seed_data(session)
-    yield session
-    session.close()
-    Base.metadata.drop_all(bind=engine)
+@pytest.fixture
+def db(empty_db):
+    """Only what compute_price reads: one indoor court and the peak and indoor rules."""
+    empty_db.add(Court(name='court_1', type=CourtType.indoor, base_hourly=600))
+    empty_db.add_all([
+        PricingRule(name='Peak 18-21', enabled=True, priority=10, applies_to='court', rule_json={
+            'match': {'start': '18:00', 'end': '21:00', 'days': ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']},
+            'modifier': {'type': 'percentage', 'value': 20}, 'stack_behavior': 'additive'
+        }),
+        PricingRule(name='Indoor +25', enabled=True, priority=8, applies_to='court', rule_json={
+            'match': {}, 'applies_to': 'indoor',
+            'modifier': {'type': 'percentage', 'value': 25}, 'stack_behavior': 'additive'
+        }),
+    ])
+    empty_db.commit()
+    return empty_db
 
-def test_base_price_calculation(db):
-    """Test base price is calculated as hourly_rate * duration_hours."""
-    court = db.query(Court).filter(Court.name == 'court_1').first()
+MONDAY = datetime.datetime(2025, 12, 15)
+FRIDAY = datetime.datetime(2025, 12, 19)
+
+@pytest.mark.parametrize('start,end,equipment,min_total,expect_rule', [
+    # Base 600/hour for one off-peak hour
+    (MONDAY.replace(hour=10), MONDAY.replace(hour=11), None, 600.0, None),
+    # Peak hours (6-9 PM) add +20%: 600 -> 720
+    (MONDAY.replace(hour=19), MONDAY.replace(hour=20), None, 720.0, 'Peak'),
+    # Indoor courts add +25%: 600 -> 750
+    (MONDAY.replace(hour=10), MONDAY.replace(hour=11), None, 750.0, 'Indoor'),
+    # Peak and indoor stack additively on a Friday evening: 600 * 1.25 * 1.2
+    (FRIDAY.replace(hour=19), FRIDAY.replace(hour=20), None, 900.0, 'Peak'),
+    # Equipment fees add to the court price: 600 + 2 * 100
+    (MONDAY.replace(hour=10), MONDAY.replace(hour=11), [{'sku': 'racket', 'quantity': 2, 'fee': 100}], 800.0, None),
+], ids=['base', 'peak', 'indoor', 'stacking', 'equipment'])
+def test_compute_price(db, start, end, equipment, min_total, expect_rule):
+    """Test base price, rule modifiers and equipment fees for the indoor court_1."""
+    court = db.query(Court).filter(Court.name == 'court_1', Court.type == CourtType.indoor).first()
     assert court is not None
     assert court.base_hourly == 600
     
-    start = datetime.datetime(2025, 12, 15, 10, 0, 0)  # Monday 10 AM
-    end = datetime.datetime(2025, 12, 15, 11, 0, 0)    # 1 hour
-    
-    result = compute_price(db, court, start, end)
+    result = compute_price(db, court, start, end, equipment=equipment)
+    # The snapshot stored with a booking carries all of these
+    assert {'base', 'line_items', 'rule_breakdown', 'total'} <= result.keys()
     assert result['base'] == 600.0
-    assert result['total'] >= 600.0
+    assert result['total'] >= min_total
+    if expect_rule:
+        assert any(r['name'].startswith(expect_rule) for r in result['rule_breakdown'])
+    if equipment:
+        assert any('Equipment' in item['name'] for item in result['line_items'])
 
-def test_peak_hours_modifier(db):
-    """Test peak hours (6-9 PM) apply +20% modifier."""
+def test_rules_cached_until_changed(db):
+    """Test rules are served from cache and reloaded after a committed change."""
+    from sqlalchemy import event
     court = db.query(Court).filter(Court.name == 'court_1').first()
-    
-    start = datetime.datetime(2025, 12, 15, 19, 0, 0)  # 7 PM (peak)
+    start = datetime.datetime(2025, 12, 15, 19, 0, 0)  # Monday 7 PM (peak)
     end = datetime.datetime(2025, 12, 15, 20, 0, 0)
-    
-    result = compute_price(db, court, start, end)
-    # Base 600 + 20% peak = 720
-    assert result['total'] >= 720.0
-    assert len(result['rule_breakdown']) > 0
-
-def test_indoor_premium_modifier(db):
-    """Test indoor courts apply +25% modifier."""
-    court = db.query(Court).filter(Court.name == 'court_1', Court.type == CourtType.indoor).first()
-    assert court is not None
-    
-    start = datetime.datetime(2025, 12, 15, 10, 0, 0)
-    end = datetime.datetime(2025, 12, 15, 11, 0, 0)
-    
-    result = compute_price(db, court, start, end)
-    # Base 600 + 25% indoor = 750
-    assert result['total'] >= 750.0
+    before = compute_price(db, court, start, end)
 
-def test_stacking_additive(db):
-    """Test multiple additive rules stack correctly."""
-    court = db.query(Court).filter(Court.name == 'court_1').first()
-    
-    # Friday 7 PM (peak + indoor)
-    start = datetime.datetime(2025, 12, 19, 19, 0, 0)  # Fri 7 PM
-    end = datetime.datetime(2025, 12, 19, 20, 0, 0)
-    
-    result = compute_price(db, court, start, end)
-    # Base 600 + 25% indoor + 20% peak (additive on base + indoor)
-    # = 600 + 150 (25%) + 150 (25% of 600) = 900?
-    # Exact calculation depends on rule order/application
-    assert result['total'] > 600.0
+    queries = []
+    counter = lambda conn, cursor, statement, *args: queries.append(statement)
+    event.listen(engine, 'before_cursor_execute', counter)
+    try:
+        assert compute_price(db, court, start, end) == before
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter)
+    assert queries == []
 
-def test_equipment_fees(db):
-    """Test equipment fees are added to base court price."""
-    court = db.query(Court).filter(Court.name == 'court_1').first()
-    
-    start = datetime.datetime(2025, 12, 15, 10, 0, 0)
-    end = datetime.datetime(2025, 12, 15, 11, 0, 0)
-    
-    equipment = [{'sku': 'racket', 'quantity': 2, 'fee': 100}]
-    result = compute_price(db, court, start, end, equipment=equipment)
-    
-    # Base 600 + equipment 200 (2 * 100)
-    assert result['total'] >= 800.0
-    assert any('Equipment' in item['name'] for item in result['line_items'])
+    peak = db.query(PricingRule).filter(PricingRule.name.like('Peak%')).first()
+    peak.enabled = False
+    db.commit()
+    after = compute_price(db, court, start, end)
+    assert after['total'] < before['total']
+    assert peak.name not in [r['name'] for r in after['rule_breakdown']]
 
-def test_price_snapshot_captured(db):
-    """Test pricing snapshot is captured and includes rule details."""
-    court = db.query(Court).filter(Court.name == 'court_1').first()
-    
-    start = datetime.datetime(2025, 12, 15, 19, 0, 0)
-    end = datetime.datetime(2025, 12, 15, 20, 0, 0)
-    
-    result = compute_price(db, court, start, end)
-    assert 'line_items' in result
-    assert 'rule_breakdown' in result
-    assert 'total' in result
-    assert result['total'] > 0
+def test_compiled_rule_matching():
+    """Test compiled rules match on weekday bits, time window and court type."""
+    from backend.pricing import compile_rule, rule_applies
+    rule = compile_rule('Evening', 1, {
+        'match': {'days': ['Mon', 'fri'], 'start': '18:00', 'end': '21:00'},
+        'applies_to': 'indoor',
+        'modifier': {'type': 'percentage', 'value': 20}
+    })
+    monday, tuesday = 1 << 0, 1 << 1
+    assert rule_applies(rule, monday, 18 * 3600, 'indoor')
+    assert not rule_applies(rule, tuesday, 18 * 3600, 'indoor')
+    assert not rule_applies(rule, monday, 21 * 3600, 'indoor')
+    assert not rule_applies(rule, monday, 19 * 3600, 'outdoor')
+    assert (rule.modifier_type, rule.value, rule.stack) == ('percentage', 20, 'additive')
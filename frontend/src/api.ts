@@ -330,14 +330,15 @@ export const cancelBooking = async (bookingId: number) => {
   return response.data;
 };
 
-export const listBookings = async (params?: { user_email?: string; status?: string; skip?: number; limit?: number }) => {
+export const listBookings = async (params?: { user_email?: string; status?: string; skip?: number; limit?: number; cursor?: string }) => {
   const searchParams = new URLSearchParams();
   if (params?.user_email) searchParams.append('user_email', params.user_email);
   if (params?.status) searchParams.append('status', params.status);
   if (params?.skip) searchParams.append('skip', params.skip.toString());
   if (params?.limit) searchParams.append('limit', params.limit.toString());
+  if (params?.cursor) searchParams.append('cursor', params.cursor);
   const response = await api.get(`/api/bookings?${searchParams}`);
-  return response.data as { bookings: Booking[]; total: number; skip: number; limit: number };
+  return response.data as { bookings: Booking[]; total: number; skip: number; limit: number; next_cursor: string | null };
 };
 
 // Admin API